@@ -2,8 +2,7 @@
 # requires-python = ">=3.13"
 # dependencies = [
 #     "matplotlib==3.10.8",
-#     "polars[pandas,pyarrow]==1.36.1",
-#     "seaborn==0.13.2",
+#     "polars==1.36.1",
 # ]
 # ///
 
@@ -16,16 +15,73 @@ app = marimo.App(width="full", app_title="CBI HBS Summary")
 @app.cell
 def _():
     import polars as pl
-    import pandas as pd
 
     import marimo as mo
-    return mo, pd, pl
+    return mo, pl
 
 
 @app.cell
-def _(mo, pl):
+def _(pl):
+    import os
+    from collections import OrderedDict
+
+    # Parsed tables of this session, shared by every view. In the browser each
+    # read is an HTTP fetch and a CSV parse, so a table is read once per
+    # version and the least recently used ones are dropped past the limit.
+    max_cached_tables = 32
+    _cached_tables = OrderedDict()
+
+    def get_version(path: str) -> str | None:
+        try:
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            # URLs of the browser build have no local version
+            return None
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def read_csv(path: str, version: str | None = None, **kwargs) -> pl.DataFrame:
+        key = (path, version or get_version(path), repr(sorted(kwargs.items())))
+        if key in _cached_tables:
+            _cached_tables.move_to_end(key)
+            return _cached_tables[key]
+        df = pl.read_csv(path, **kwargs)
+        _cached_tables[key] = df
+        while len(_cached_tables) > max_cached_tables:
+            _cached_tables.popitem(last=False)
+        return df
+    return (read_csv,)
+
+
+@app.cell
+def _(mo, pl, read_csv):
+    # The deployed site publishes compressed copies of the data files under
+    # content hashed names (see `cbi_hbs_summary.static_data`), listed in a
+    # manifest. Without the manifest, as in a checkout of the repository,
+    # the files are read from Data directly.
+    _data_dir = mo.notebook_location() / "Data"
+    try:
+        data_files = dict(
+            read_csv(str(_data_dir / "data_manifest.csv.gz"))
+            .select("Path", "Hashed_Path")
+            .iter_rows()
+        )
+    except OSError:
+        # A missing local file, or a failed request in the browser build
+        data_files = None
+
+    def read_data(path: str, **kwargs) -> pl.DataFrame:
+        if data_files is None:
+            return read_csv(str(_data_dir / path), **kwargs)
+        # A hashed name changes with the content, so it versions the cache
+        hashed_path = data_files[path]
+        return read_csv(str(_data_dir / hashed_path), version=hashed_path, **kwargs)
+    return (read_data,)
+
+
+@app.cell
+def _(pl, read_data):
     index = (
-        pl.read_csv(str(mo.notebook_location() / "Data/index.csv"))
+        read_data("index.csv")
         .with_columns(
             pl.col("Table_Number").str.replace(r" (?<number>\d)$", r" ۰${number}")
         )
@@ -44,11 +100,84 @@ def _(index, mo):
 
 
 @app.cell
-def _(index, mo, pl, year):
+def _(pl, read_data):
+    # Folded tokens of every table name and the characters folding queries,
+    # built offline by draft.py with `cbi_hbs_summary.search`. The package
+    # is not available in the browser, so queries are folded here with its
+    # published replacements.
+    _folding = str.maketrans(dict(
+        read_data(
+            "search_folding.csv",
+            schema={"Character": pl.String, "Replacement": pl.String},
+        ).iter_rows()
+    ))
+
+    # The names containing each token, every prefix of a token and the
+    # prefixes within one deleted character of each prefix, so a keystroke
+    # costs a few dictionary lookups
+    _names = {}
+    for _name, _tokens in read_data("search_index.csv").iter_rows():
+        for _token in _tokens.split(" "):
+            _names.setdefault(_token, set()).add(_name)
+    _prefix_tokens = {}
+    for _token in _names:
+        for _n in range(1, len(_token) + 1):
+            _prefix_tokens.setdefault(_token[:_n], set()).add(_token)
+    _deletions = {}
+    for _prefix in _prefix_tokens:
+        if len(_prefix) >= 3:
+            for _n in range(len(_prefix)):
+                _deletions.setdefault(_prefix[:_n] + _prefix[_n + 1:], set()).add(_prefix)
+
+    def get_deletions(text: str) -> set[str]:
+        return {text[:n] + text[n + 1:] for n in range(len(text))}
+
+    def match_token(query: str) -> set[str]:
+        if query in _prefix_tokens:
+            return _prefix_tokens[query]
+        if len(query) < 3:
+            return set()
+        # Prefixes one substitution, insertion, deletion or transposition away
+        deletions = get_deletions(query)
+        prefixes = set(_deletions.get(query, ()))
+        prefixes.update(d for d in deletions if d in _prefix_tokens)
+        for deletion in deletions:
+            prefixes.update(_deletions.get(deletion, ()))
+        return {t for p in prefixes for t in _prefix_tokens[p]}
+
+    def search_table_names(query: str) -> set[str] | None:
+        """
+        The table names matching every token of `query`, or None without a
+        query.
+        """
+        tokens = query.translate(_folding).strip().removesuffix(".0").lower().split()
+        if not tokens:
+            return None
+        names = None
+        for token in tokens:
+            matches = {n for t in match_token(token) for n in _names[t]}
+            names = matches if names is None else names & matches
+        return names
+    return (search_table_names,)
+
+
+@app.cell
+def _(mo):
+    search = mo.ui.text(placeholder="Table name", label="Search all years", debounce=150)
+    return (search,)
+
+
+@app.cell
+def _(index, mo, pl, search, search_table_names, year):
+    _table_names = search_table_names(search.value)
+    if _table_names is not None:
+        _filter = pl.col("Table_Name").is_in(list(_table_names))
+    elif year.value:
+        _filter = pl.col("Year").eq(year.value)
+    else:
+        _filter = True
     index_table = mo.ui.table(
-        index.filter(
-            pl.col("Year").eq(year.value) if year.value else True
-        ),
+        index.filter(_filter),
         pagination=True,
         page_size=30,
         selection="single",
@@ -59,7 +188,7 @@ def _(index, mo, pl, year):
 
 
 @app.cell
-def _(index_table, mo, pl):
+def _(index_table, pl, read_data):
     def get_selected_table() -> pl.DataFrame | None:
         selected_row = index_table.value
         if len(selected_row) == 0:
@@ -69,8 +198,7 @@ def _(index_table, mo, pl):
             return
         file_name = selected_row["Table_Number"] + "-" + selected_row["Table_Name"]
         file_name = file_name.replace(" ", "_") + ".csv"
-        file_path = str(mo.notebook_location()) + f"/Data/CSV_Files/{str(selected_row['Year'])}/{file_name}"
-        return pl.read_csv(file_path)
+        return read_data(f"CSV_Files/{selected_row['Year']}/{file_name}")
     return (get_selected_table,)
 
 
@@ -91,10 +219,10 @@ def _(get_selected_table, mo):
 
 
 @app.cell
-def _(index_table, mo, selected_table, year):
+def _(index_table, mo, search, selected_table, year):
     raw_tables = mo.vstack(
         [
-            year,
+            mo.hstack([year, search], justify="start"),
             mo.md("---"),
             mo.hstack(
                 [
@@ -124,28 +252,31 @@ def _(mo):
 
 
 @app.cell
-def _(cleaned_table_name, mo, pl):
-    cleaned_table_path = str(
-        mo.notebook_location() /
-        "Data/Cleaned_Tables" /
-        f"{cleaned_table_name.value}.csv"
-    )
-    cleaned_table = pl.read_csv(cleaned_table_path)
-    return (cleaned_table,)
-
+def _(cleaned_table_name, mo, read_data):
+    def get_cleaned_table_view():
+        cleaned_table = read_data(f"Cleaned_Tables/{cleaned_table_name.value}.csv")
+        return mo.ui.dataframe(cleaned_table, page_size=30)
 
-@app.cell
-def _(cleaned_table, cleaned_table_name, mo):
+    # The table is read when the tab is first opened
     cleaned_tables = mo.vstack(
         [
             cleaned_table_name,
             mo.md("---"),
-            mo.ui.dataframe(cleaned_table, page_size=30),
+            mo.lazy(get_cleaned_table_view, show_loading_indicator=True),
         ]
     )
     return (cleaned_tables,)
 
 
+@app.cell
+def _(pl, read_data):
+    def get_comparison_bundle() -> pl.DataFrame:
+        # Every comparison table in one file, fetched once instead of on each
+        # change of the column dropdown
+        return read_data("Comparison_Bundle/comparisons.csv", schema_overrides={"Year": pl.Int16})
+    return (get_comparison_bundle,)
+
+
 @app.cell
 def _(columns, mo):
     plot_table = mo.ui.dropdown(list(columns.keys()), "household_appliances_access", label="Table")
@@ -170,17 +301,6 @@ def _(mo):
     return (log_scale,)
 
 
-@app.cell
-def _(mo):
-    def get_file_path(table: str, column: str) -> str:
-        # comparison_tables_dir = Path("Data/Comparison_Tables")
-        # file_path = comparison_tables_dir / f"{table}/{column}.csv"
-        # file_path.parent.mkdir(exist_ok=True, parents=True)
-        file_path = str(mo.notebook_location()) + f"/Data/Comparison_Tables/{table}/{column}.csv"
-        return file_path
-    return (get_file_path,)
-
-
 @app.cell
 def _():
     columns = {
@@ -297,37 +417,30 @@ def _():
 @app.cell
 def _(
     column,
-    get_file_path,
+    get_comparison_bundle,
     include_zero,
     log_scale,
-    pd,
+    mo,
     pl,
     plot_table,
     title_mapping,
 ):
-    import matplotlib.pyplot as plt
-    import seaborn as sns
+    # Plotted sources in legend order, with their colors
+    sources = {
+        "SCI_All": "#94B4C1",
+        "SCI_Urban": "#547792",
+        "SCI_CBI_Sample": "#213448",
+        "CBI": "#FA6868",
+    }
 
     def plot_comparision(): 
-        title = title_mapping.get((plot_table.value, column.value), column.value)
+        # Imported when the comparison tab is first opened
+        import matplotlib.pyplot as plt
 
-        plot_data = (
-            pd.DataFrame(pl.read_csv(get_file_path(plot_table.value, column.value)).to_dict())
-            .set_index("Year")
-            .rename_axis("Source", axis="columns")
-            .stack(future_stack=True)
-            .dropna()
-            .rename("Value")
-            .reset_index()
-            .assign(Source=lambda df: df["Source"].str.replace("_", " "))
-            .astype({
-                "Source": pd.CategoricalDtype(
-                    ["SCI All", "SCI Urban", "SCI CBI Sample", "CBI"],
-                    ordered=True,
-                )
-            })
-        )
+        comparison_bundle = get_comparison_bundle()
+        title = title_mapping.get((plot_table.value, column.value), column.value)
 
+        scale = 1
         if plot_table.value == "household_size":
             ylabel = "Average Household Size"
         elif plot_table.value in [
@@ -344,19 +457,37 @@ def _(
             ylabel = "Percentage of Expenditures (%)"
         else:
             ylabel = "Thousand Tomans"
-            plot_data["Value"] = plot_data["Value"].div(1e4)
-
-        sns.set_theme()
-        fig, ax = plt.subplots(figsize=(10, 5))
-
-        ax = sns.lineplot(
-            plot_data,
-            x="Year",
-            y="Value",
-            hue="Source",
-            palette=["#94B4C1", "#547792", "#213448", "#FA6868"],
-            marker="o",
+            scale = 1e-4
+
+        # Reshaped in Polars, only the NumPy buffers of each source reach
+        # matplotlib. Standard errors and confidence bounds are not plotted.
+        plot_data = (
+            comparison_bundle
+            .filter(pl.col("Table") == plot_table.value, pl.col("Column") == column.value)
+            .unpivot(
+                on=[s for s in sources if s in comparison_bundle.columns],
+                index="Year",
+                variable_name="Source",
+                value_name="Value",
+            )
+            .drop_nulls("Value")
+            .with_columns(pl.col("Source").cast(pl.Enum(list(sources))), pl.col("Value").mul(scale))
+            .sort("Source", "Year")
         )
+        if plot_data.is_empty():
+            return mo.callout(mo.md(f"No comparison table for **{title}** yet."), kind="warn")
+
+        with plt.style.context("seaborn-v0_8-darkgrid"):
+            fig, ax = plt.subplots(figsize=(10, 5))
+            for (source,), source_data in plot_data.partition_by("Source", as_dict=True, maintain_order=True).items():
+                ax.plot(
+                    source_data.get_column("Year").to_numpy(),
+                    source_data.get_column("Value").to_numpy(),
+                    color=sources[source],
+                    marker="o",
+                    label=source.replace("_", " "),
+                )
+            ax.legend(title="Source")
 
         ax.set_title(f"Comparative Analysis of {title} (SCI vs. CBI)", fontsize=18)
         ax.set_xlabel("")
@@ -375,16 +506,12 @@ def _(
 
 @app.cell
 def _(column, include_zero, log_scale, mo, plot_comparision, plot_table):
-    try:
-        fig = plot_comparision()
-    except Exception as e:
-        raise e
-
+    # The bundle is fetched and the figure drawn when the tab is first opened
     comparision = mo.vstack(
         [
             mo.hstack([plot_table, column], justify="start"),
             mo.hstack([include_zero, log_scale], justify="start"),
-            fig,
+            mo.lazy(plot_comparision, show_loading_indicator=True),
         ]
     )
     return (comparision,)
@@ -0,0 +1,207 @@
+"""
+Checks of the optimized functions of the pipeline against straightforward
+reference implementations, on inputs generated like the benchmarks:
+
+    uv run python benchmarks/check.py
+    uv run python benchmarks/check.py --only sanitize_farsi_text --cells 1000000
+
+Every check raises an AssertionError on the first mismatch.
+"""
+
+import argparse
+from collections.abc import Callable
+import random
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal, assert_series_equal
+
+from cbi_hbs_summary import sci, utils
+
+import synthetic
+
+
+def reference_sanitize_farsi_text(column: pl.Expr) -> pl.Expr:
+    """
+    The six pass chain `utils.sanitize_farsi_text` replaced.
+    """
+    return (
+        column
+        .str.replace_many(utils.ARABIC_CHARACTERS)
+        .str.replace_all(chr(8204), " ")
+        .str.replace_all(
+            "[" + "".join(utils.INVISIBLE_CHARS + utils.UNWANTED_SYMBOLS).replace("*", "\\*") + "]", ""
+        )
+        .str.replace_all("\\s+", " ")
+        .str.strip_chars()
+        .str.replace(r"\.0$", "")
+    )
+
+
+def create_farsi_corpus(n: int, seed: int = 0) -> pl.Series:
+    """
+    Random texts of Farsi and Arabic letters, digits, every replaced
+    character and every Unicode whitespace character.
+    """
+    rng = random.Random(seed)
+    alphabet = [
+        *"ابپتجچخدرزسشعفقکگلمنوهی0123456789.",
+        *utils.ARABIC_CHARACTERS,
+        *utils.INVISIBLE_CHARS,
+        *utils.UNWANTED_SYMBOLS,
+        chr(8204),
+        *" \t\n\v\f\r\x85\xa0        　",
+        ".0",
+    ]
+    return pl.Series(
+        "cell",
+        ["".join(rng.choices(alphabet, k=rng.randint(0, 30))) for _ in range(n)],
+        dtype=pl.String,
+    )
+
+
+def check_sanitize_farsi_text(args: argparse.Namespace) -> str:
+    cells = create_farsi_corpus(args.cells)
+    df = cells.to_frame()
+    expected = df.select(pl.col("cell").pipe(reference_sanitize_farsi_text)).to_series()
+    fused = df.select(pl.col("cell").pipe(utils.sanitize_farsi_text)).to_series()
+    twin = pl.Series("cell", [utils.sanitize_farsi_string(c) for c in cells], dtype=pl.String)
+    assert_series_equal(fused, expected)
+    assert_series_equal(twin, expected)
+    return f"{args.cells:,} cells"
+
+
+def create_households(args: argparse.Namespace) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Household properties and a Value table covering most of them, with a few
+    null values.
+    """
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties).with_columns(
+        pl.when(pl.col("ID") % 97 != 0).then(pl.col("Value")).alias("Value")
+    )
+    return household_properties, table
+
+
+def iter_segment_values(household_properties: pl.DataFrame, table: pl.DataFrame):
+    """
+    Year, segment column name, values and weights of the households of every
+    segment found in `table` with a value, one year and segment at a time.
+    """
+    households = household_properties.join(table, on=["Year", "ID"]).drop_nulls("Value")
+    for (year,), group in households.sort("Year").group_by("Year", maintain_order=True):
+        for segment in sci.SEGMENTS:
+            members = group.filter(segment.condition)
+            yield (
+                year,
+                f"SCI_{segment.name}",
+                members.get_column("Value").to_numpy(),
+                members.get_column("Weight").to_numpy(),
+            )
+
+
+def check_create_quantiles(args: argparse.Namespace) -> str:
+    household_properties, table = create_households(args)
+    quantiles = [i / 100 for i in range(1, 100)]
+    records = {}
+    for year, name, values, weights in iter_segment_values(household_properties, table):
+        result = np.quantile(values, quantiles, weights=weights, method="inverted_cdf")
+        for q, value in zip(quantiles, result):
+            records.setdefault((year, q), {})[name] = value
+    expected = pl.DataFrame(
+        [{"Year": year, "Quantile": q, **values} for (year, q), values in records.items()],
+        schema_overrides={"Year": pl.Int16},
+    ).sort("Quantile", "Year")
+    result = sci.create_quantiles(table, household_properties, ["Value"], quantiles)
+    assert_frame_equal(result.drop("Indicator"), expected.select(result.drop("Indicator").columns))
+    return f"{household_properties.height:,} households, 99 quantiles"
+
+
+def check_create_shares(args: argparse.Namespace) -> str:
+    household_properties, table = create_households(args)
+    n = 10
+    records = {}
+    for year, name, values, weights in iter_segment_values(household_properties, table):
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        share = (np.cumsum(weights) - weights / 2) / weights.sum()
+        tiles = np.clip(np.floor(share * n), 0, n - 1).astype(int) + 1
+        totals = values * weights
+        for tile in range(1, n + 1):
+            records.setdefault((year, tile), {})[name] = totals[tiles == tile].sum() / totals.sum() * 100
+    expected = pl.DataFrame(
+        [{"Year": year, "N_Tile": tile, **values} for (year, tile), values in records.items()],
+        schema_overrides={"Year": pl.Int16, "N_Tile": pl.Int8},
+    ).sort("N_Tile", "Year")
+    result = sci.create_shares(table, household_properties, ["Value"], n)
+    assert_frame_equal(
+        result.drop("Indicator"), expected.select(result.drop("Indicator").columns), rel_tol=1e-9,
+    )
+    return f"{household_properties.height:,} households, {n} n-tiles"
+
+
+def check_replicate_weights(args: argparse.Namespace) -> str:
+    household_properties, table = create_households(args)
+    rng = np.random.default_rng(0)
+    names = [f"Replicate_{i}" for i in range(args.replicates)]
+    # Random half sample multipliers, each household dropped or doubled
+    multipliers = rng.choice([0.0, 2.0], size=(household_properties.height, args.replicates))
+    household_properties = household_properties.with_columns(
+        pl.col("Weight").mul(pl.Series(name, multipliers[:, i])).alias(name) for i, name in enumerate(names)
+    )
+    variance_factor = 1 / args.replicates
+
+    # One weighted mean per replicate weight column, missing values as zero
+    households = household_properties.join(table, on=["Year", "ID"], how="left").with_columns(
+        pl.col("Value").fill_null(0)
+    )
+    records = []
+    for (year,), group in households.sort("Year").group_by("Year", maintain_order=True):
+        record = {"Year": year}
+        for segment in sci.SEGMENTS:
+            members = group.filter(segment.condition)
+            values = members.get_column("Value").to_numpy()
+            estimate = np.average(values, weights=members.get_column("Weight").to_numpy())
+            replicates = [np.average(values, weights=members.get_column(name).to_numpy()) for name in names]
+            name = f"SCI_{segment.name}"
+            record[name] = estimate
+            record[f"{name}_SE"] = np.sqrt(variance_factor * sum((r - estimate) ** 2 for r in replicates))
+        records.append(record)
+    expected = pl.DataFrame(records, schema_overrides={"Year": pl.Int16})
+
+    result = sci.create_sci_values(
+        table, household_properties, replicate_weights=names, variance_factor=variance_factor,
+    )
+    assert_frame_equal(result.select(expected.columns), expected, rel_tol=1e-9)
+    return f"{household_properties.height:,} households, {args.replicates} replicate weights"
+
+
+CHECKS: dict[str, Callable[[argparse.Namespace], str]] = {
+    "sanitize_farsi_text": check_sanitize_farsi_text,
+    "create_quantiles": check_create_quantiles,
+    "create_shares": check_create_shares,
+    "replicate_weights": check_replicate_weights,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=CHECKS, default=list(CHECKS))
+    parser.add_argument("--cells", type=int, default=200_000, help="cells to sanitize")
+    parser.add_argument("--first-year", type=int, default=1398)
+    parser.add_argument("--last-year", type=int, default=1403)
+    parser.add_argument("--households", type=int, default=5_000, help="households per year")
+    parser.add_argument("--replicates", type=int, default=20, help="replicate weight columns")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    for name in args.only:
+        size = CHECKS[name](args)
+        print(f"{name:<26} {size:<52} ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Micro-benchmarks of the hot functions of the pipeline.
+
+Every input is generated by `synthetic.py`, so the suite runs offline:
+
+    uv run python benchmarks/run.py
+    uv run python benchmarks/run.py --only sanitize_farsi_text --cells 1000000
+    uv run python benchmarks/run.py --json bench.json
+
+Each benchmark is run `--repeat` times and the minimum and median are
+reported in milliseconds.
+"""
+
+import argparse
+import atexit
+from collections.abc import Callable
+import json
+from pathlib import Path
+import random
+import shutil
+import statistics
+import tempfile
+import timeit
+
+import polars as pl
+
+from cbi_hbs_summary import extraction, metadata, sci, segments, utils
+
+import synthetic
+
+
+def create_farsi_cells(n: int, seed: int = 0) -> pl.Series:
+    """
+    Raw cell texts with Arabic characters, invisible characters, unwanted
+    symbols and irregular whitespace, as found in the CBI workbooks.
+    """
+    rng = random.Random(seed)
+    words = ["هزينه", "خانوار", "كالا", "سال", "درآمد", "متوسط", "شهری", "1402.0", "12.5"]
+    noise = [*utils.INVISIBLE_CHARS, *utils.UNWANTED_SYMBOLS, chr(8204), "  ", "\xa0", " "]
+    return pl.Series(
+        "cell",
+        [
+            "".join(rng.choice(words) + rng.choice(noise) for _ in range(rng.randint(1, 6)))
+            for _ in range(n)
+        ],
+    )
+
+
+def bench_sanitize_farsi_text(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    df = create_farsi_cells(args.cells).to_frame()
+    expr = pl.col("cell").pipe(utils.sanitize_farsi_text)
+    return f"{args.cells:,} cells", lambda: df.select(expr)
+
+
+def bench_get_rename_dict(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    column_names = metadata.load("column_names")
+    lookups = []
+    for table_name, table_column_names in column_names.items():
+        if table_name == "_general":
+            continue
+        versions = [k for k in table_column_names if isinstance(k, int)]
+        for year in range(min(versions, default=args.first_year), args.last_year + 1):
+            lookups.append((table_name, year))
+
+    def run() -> None:
+        for table_name, year in lookups:
+            metadata.get_rename_dict(table_name, year)
+
+    return f"{len(lookups):,} lookups", run
+
+
+def bench_extract_standard_tables(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    directory = Path(tempfile.mkdtemp(prefix="cbi_hbs_bench_"))
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    years = range(args.first_year, args.last_year + 1)
+    sheet_names = synthetic.write_workbooks(
+        directory / "Excel_Files",
+        years,
+        rows=args.rows,
+        filler_rows=args.filler_rows,
+        filler_columns=args.filler_columns,
+    )
+    jobs = [
+        extraction.YearJob(
+            year=year,
+            file=directory / "Excel_Files" / f"{year}.xlsx",
+            standard_tables={args.table: sheet_names[year][args.table]},
+        )
+        for year in years
+    ]
+
+    def run() -> pl.DataFrame:
+        results = extraction.extract_years(jobs, directory / "CSV_Files", n_jobs=args.jobs)
+        return extraction.merge_standard_tables(r.standard_tables for r in results)[args.table]
+
+    return f"{args.table}, {len(jobs)} workbooks", run
+
+
+def bench_create_sci_values(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties)
+    return (
+        f"{household_properties.height:,} households",
+        lambda: sci.create_sci_values(table, household_properties),
+    )
+
+
+def bench_create_sci_values_batched(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties)
+    columns = [f"Value_{i}" for i in range(args.indicators)]
+    table = table.select("Year", "ID", *(pl.col("Value").mul(i + 1).alias(c) for i, c in enumerate(columns)))
+    return (
+        f"{household_properties.height:,} households, {args.indicators} indicators",
+        lambda: sci.create_sci_values(table, household_properties, columns),
+    )
+
+
+def bench_create_sci_values_segments(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties)
+    columns = [f"Value_{i}" for i in range(args.indicators)]
+    table = table.select("Year", "ID", *(pl.col("Value").mul(i + 1).alias(c) for i, c in enumerate(columns)))
+    # The default segments, rural households and 31 provinces
+    segment_list = [*sci.SEGMENTS, segments.RURAL, segments.PROVINCE]
+    return (
+        f"{household_properties.height:,} households, {args.indicators} indicators, 35 segments",
+        lambda: sci.create_sci_values(table, household_properties, columns, segments=segment_list),
+    )
+
+
+def bench_create_sci_values_replicates(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties)
+    columns = [f"Value_{i}" for i in range(args.indicators)]
+    table = table.select("Year", "ID", *(pl.col("Value").mul(i + 1).alias(c) for i, c in enumerate(columns)))
+    return (
+        f"{household_properties.height:,} households, {args.indicators} indicators, {args.replicates} replicates",
+        lambda: sci.create_sci_values(table, household_properties, columns, replicates=args.replicates),
+    )
+
+
+def bench_create_quantiles(args: argparse.Namespace) -> tuple[str, Callable[[], object]]:
+    years = range(args.first_year, args.last_year + 1)
+    household_properties = synthetic.create_household_properties(years, args.households)
+    table = synthetic.create_household_table(household_properties)
+    quantiles = [i / 100 for i in range(1, 100)]
+    return (
+        f"{household_properties.height:,} households, 99 quantiles",
+        lambda: sci.create_quantiles(table, household_properties, ["Value"], quantiles),
+    )
+
+
+BENCHMARKS = {
+    "sanitize_farsi_text": bench_sanitize_farsi_text,
+    "get_rename_dict": bench_get_rename_dict,
+    "extract_standard_tables": bench_extract_standard_tables,
+    "create_sci_values": bench_create_sci_values,
+    "create_sci_values_batched": bench_create_sci_values_batched,
+    "create_sci_values_segments": bench_create_sci_values_segments,
+    "create_sci_values_replicates": bench_create_sci_values_replicates,
+    "create_quantiles": bench_create_quantiles,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cells", type=int, default=200_000, help="cells to sanitize")
+    parser.add_argument("--first-year", type=int, default=1380)
+    parser.add_argument("--last-year", type=int, default=1403)
+    parser.add_argument("--table", default="annual_gross_expenditure_by_group", choices=synthetic.STANDARD_TABLES)
+    parser.add_argument("--rows", type=int, default=8, help="years in each standard table")
+    parser.add_argument("--filler-rows", type=int, default=20, help="rows of the other sheets")
+    parser.add_argument("--filler-columns", type=int, default=10, help="columns of the other sheets")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes of the extraction")
+    parser.add_argument("--households", type=int, default=40_000, help="households per year")
+    parser.add_argument("--indicators", type=int, default=60, help="value columns of the batched create_sci_values")
+    parser.add_argument("--replicates", type=int, default=200, help="bootstrap replicates of create_sci_values")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = []
+    for name in args.only:
+        size, run = BENCHMARKS[name](args)
+        # One warm up call, so lazy initialization is not measured
+        run()
+        times = [t * 1000 for t in timeit.repeat(run, number=1, repeat=args.repeat)]
+        results.append({
+            "benchmark": name,
+            "size": size,
+            "min_ms": round(min(times), 3),
+            "median_ms": round(statistics.median(times), 3),
+        })
+        print(f"{name:<26} {size:<52} min {min(times):10.2f} ms   median {statistics.median(times):10.2f} ms")
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Synthetic CBI style workbooks and household tables for the benchmarks.
+
+The workbooks follow the layout of the published CBI files: a "فهرست جداول"
+index sheet listing "جدول شماره <Persian number>: <table name>", one sheet per
+table, and standard tables written either with the years as rows or
+transposed with the years as columns. Everything is generated from the
+package metadata, so no network access or real data is needed.
+"""
+
+from collections.abc import Iterable
+from pathlib import Path
+import random
+
+import polars as pl
+import xlsxwriter
+
+from cbi_hbs_summary import metadata
+
+
+INDEX_SHEET = "فهرست جداول"
+
+PERSIAN_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+STANDARD_TABLES = [
+    "annual_consumption_quantity_food_beverages_tobacco",
+    "annual_gross_expenditure_by_group",
+    "employment_status_6_plus",
+    "household_appliances_access",
+    "household_distribution_by_members",
+    "household_distribution_by_number_of_employed",
+    "household_facilities_access",
+    "household_size",
+    "housing_rooms",
+]
+
+
+def get_sheet_name(table_number: int) -> str:
+    return f"جدول شماره {str(table_number).translate(PERSIAN_DIGITS)}"
+
+
+def get_table_labels(table_name: str, year: int) -> tuple[str, list[str]]:
+    """
+    The label of the year column and the labels of the value columns that the
+    metadata expects for `table_name` in `year`.
+    """
+    column_names = metadata.load("column_names")[table_name]
+    if all(isinstance(k, int) for k in column_names):
+        column_names = column_names[max(k for k in column_names if k <= year)]
+    year_label = "سال"
+    labels = []
+    seen = set()
+    for label, name in column_names.items():
+        if name == "Year":
+            year_label = label
+            continue
+        if name is None or name == "col" or name in seen:
+            continue
+        seen.add(name)
+        labels.append(label)
+    return year_label, labels
+
+
+def write_workbook(
+    path: str | Path,
+    year: int,
+    *,
+    rows: int = 8,
+    filler_rows: int = 20,
+    filler_columns: int = 10,
+    seed: int = 0,
+) -> dict[str, str]:
+    """
+    Write the workbook of one year and return the sheet name of each standard
+    table.
+
+    Standard tables hold `rows` years ending in `year`, odd numbered tables are
+    transposed. The other tables are filled with `filler_rows` by
+    `filler_columns` cells of Farsi text and numbers.
+    """
+    rng = random.Random(f"{seed}-{year}")
+    table_names = {name: farsi_name for farsi_name, name in metadata.load("table_names").items()}
+    sheet_names = {}
+
+    workbook = xlsxwriter.Workbook(str(path))
+    index_sheet = workbook.add_worksheet(INDEX_SHEET)
+    index_sheet.write(0, 0, INDEX_SHEET)
+    for table_number, (name, farsi_name) in enumerate(table_names.items(), start=1):
+        sheet_name = get_sheet_name(table_number)
+        index_sheet.write(table_number, 0, f"{sheet_name}: {farsi_name}")
+        sheet = workbook.add_worksheet(sheet_name)
+
+        if name not in STANDARD_TABLES:
+            grid = [[farsi_name]] + [
+                [
+                    f"ردیف {str(r).translate(PERSIAN_DIGITS)}" if c == 0 else round(rng.uniform(0, 1000), 1)
+                    for c in range(filler_columns)
+                ]
+                for r in range(filler_rows)
+            ]
+        else:
+            sheet_names[name] = sheet_name
+            year_label, labels = get_table_labels(name, year)
+            years = list(range(year - rows + 1, year + 1))
+            values = [[round(rng.uniform(0, 100), 2) for _ in labels] for _ in years]
+            if table_number % 2:
+                grid = [[year_label, *map(str, years)]] + [
+                    [label, *(row[i] for row in values)]
+                    for i, label in enumerate(labels)
+                ]
+            else:
+                grid = [[year_label, *labels]] + [
+                    [y, *row] for y, row in zip(years, values)
+                ]
+
+        for r, row in enumerate(grid):
+            for c, value in enumerate(row):
+                sheet.write(r, c, value)
+    workbook.close()
+    return sheet_names
+
+
+def write_workbooks(
+    directory: str | Path,
+    years: Iterable[int],
+    **kwargs,
+) -> dict[int, dict[str, str]]:
+    """
+    Write one `<year>.xlsx` workbook per year into `directory`.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return {
+        year: write_workbook(directory / f"{year}.xlsx", year, **kwargs)
+        for year in years
+    }
+
+
+def create_household_properties(
+    years: Iterable[int],
+    households: int,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Year, ID, Weight, Urban_Rural, CBI_Sample and Province of `households`
+    households per year, shaped like the household properties of `sci_hbs.py`.
+    """
+    rng = random.Random(seed)
+    years = list(years)
+    size = len(years) * households
+    return pl.DataFrame(
+        {
+            "Year": [y for y in years for _ in range(households)],
+            "ID": [i for _ in years for i in range(households)],
+            "Weight": [rng.uniform(100, 1000) for _ in range(size)],
+            "Urban_Rural": [rng.choice(["Urban", "Rural"]) for _ in range(size)],
+            "CBI_Sample": [rng.random() < 0.6 for _ in range(size)],
+            "Province": [rng.randrange(31) for _ in range(size)],
+        },
+        schema={
+            "Year": pl.Int16,
+            "ID": pl.Int64,
+            "Weight": pl.Float64,
+            "Urban_Rural": pl.String,
+            "CBI_Sample": pl.Boolean,
+            "Province": pl.Int8,
+        },
+    )
+
+
+def create_household_table(
+    household_properties: pl.DataFrame,
+    column: str = "Value",
+    coverage: float = 0.9,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    A Year, ID, `column` table covering a share of the households.
+    """
+    rng = random.Random(seed)
+    table = household_properties.select("Year", "ID").filter(
+        pl.Series([rng.random() < coverage for _ in range(household_properties.height)])
+    )
+    return table.with_columns(
+        pl.Series(column, [rng.uniform(0, 1e6) for _ in range(table.height)])
+    )
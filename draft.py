@@ -14,13 +14,12 @@ app = marimo.App(width="medium")
 @app.cell
 def _():
     from pathlib import Path
-    import re
 
-    import fastexcel
+    import marimo as mo
     import polars as pl
 
     import cbi_hbs_summary
-    return Path, cbi_hbs_summary, fastexcel, pl, re
+    return Path, cbi_hbs_summary, mo, pl
 
 
 @app.cell
@@ -31,7 +30,20 @@ def _(Path):
 
     cleaned_dir = DATA_DIR / "Cleaned_Tables"
     cleaned_dir.mkdir(exist_ok=True)
-    return DATA_DIR, cleaned_dir, csv_dir, excel_dir
+
+    cache_dir = DATA_DIR / ".cache"
+    standard_cache_dir = cache_dir / "standard_tables"
+    return DATA_DIR, cache_dir, cleaned_dir, csv_dir, excel_dir, standard_cache_dir
+
+
+@app.cell
+def _(Path, cache_dir, cbi_hbs_summary):
+    # Hashes of the workbooks, metadata and outputs of the last run, so only
+    # the years and tables whose inputs changed are extracted again
+    manifest = cbi_hbs_summary.manifest.Manifest(cache_dir / "extraction_manifest.json")
+    metadata_dir = Path(cbi_hbs_summary.metadata.__file__).parent
+    metadata_hash = manifest.hash_files(sorted(metadata_dir.rglob("*.yaml")))
+    return manifest, metadata_hash
 
 
 @app.cell
@@ -54,158 +66,242 @@ def _(pl):
 
 
 @app.cell
-def _(DATA_DIR, cbi_hbs_summary, excel_dir, extract_year_index, fastexcel, pl):
+def _(cbi_hbs_summary, excel_dir):
+    # Shared by the index, raw and standardized passes so each workbook is opened once
+    reader_pool = cbi_hbs_summary.readers.ReaderPool(
+        maxsize=max(1, len(list(excel_dir.glob("*.xlsx"))))
+    )
+    return (reader_pool,)
+
+
+@app.cell
+def _(
+    DATA_DIR,
+    cbi_hbs_summary,
+    excel_dir,
+    extract_year_index,
+    manifest,
+    pl,
+    reader_pool,
+):
+    index_path = DATA_DIR / "index.csv"
+    previous_index = None
+    if index_path.exists():
+        previous_index = pl.read_csv(
+            index_path,
+            schema={
+                "Year": pl.UInt16,
+                "Table_Number": pl.String,
+                "Table_Name": pl.String,
+                "Available": pl.Int8,
+            },
+        )
+
     df_list = []
     for file in excel_dir.iterdir():
-        reader = fastexcel.read_excel(file)
+        index_inputs = {"workbook": manifest.hash_file(file)}
+        if previous_index is not None and manifest.is_fresh(f"index/{file.stem}", index_inputs):
+            df_list.append(previous_index.filter(pl.col("Year").eq(int(file.stem))))
+            continue
+        reader = reader_pool.get(file)
         df_list.append(
             extract_year_index(reader)
             .select(
                 pl.lit(file.stem).cast(pl.UInt16).alias("Year"),
                 pl.all(),
             )
+            .with_columns(
+                pl.col("Table_Name").pipe(cbi_hbs_summary.utils.sanitize_farsi_text),
+            )
         )
-    index = (
-        pl.concat(df_list)
-        .with_columns(
-            pl.col("Table_Name").pipe(cbi_hbs_summary.utils.sanitize_farsi_text),
-        )
-    )
-    index.write_csv(DATA_DIR / "index.csv")
+        manifest.record(f"index/{file.stem}", index_inputs)
+    index = pl.concat(df_list)
+    cbi_hbs_summary.manifest.write_if_changed(index_path, index.write_csv().encode())
     return (index,)
 
 
 @app.cell
-def _(DATA_DIR, index, pl):
+def _(DATA_DIR, cbi_hbs_summary, index, pl):
     available_tables = (
         index
         .filter(pl.col("Available").gt(0))
         .pivot(index="Year", on="Table_Name", values="Table_Number")
     )
-    available_tables.write_csv(DATA_DIR / "available_tables.csv")
+    cbi_hbs_summary.manifest.write_if_changed(
+        DATA_DIR / "available_tables.csv", available_tables.write_csv().encode()
+    )
     return (available_tables,)
 
 
 @app.cell
-def _(excel_dir, fastexcel):
-    def get_year_file_reader(year: int) -> fastexcel.ExcelReader:
-        file = excel_dir / f"{year}.xlsx"
-        reader = fastexcel.read_excel(file)
-        return reader
-    return (get_year_file_reader,)
+def _(DATA_DIR, cbi_hbs_summary, index):
+    # Folded tokens of the table names and the characters folding queries,
+    # for the search box of the app
+    search_index = cbi_hbs_summary.search.build_search_index(index)
+    cbi_hbs_summary.manifest.write_if_changed(
+        DATA_DIR / "search_index.csv", search_index.write_csv().encode()
+    )
+    cbi_hbs_summary.manifest.write_if_changed(
+        DATA_DIR / "search_folding.csv",
+        cbi_hbs_summary.search.build_query_folding().write_csv().encode(),
+    )
+    return
+
+
+@app.cell
+def _(mo):
+    # Number of worker processes, e.g. `python draft.py --jobs 4`
+    n_jobs = int(mo.cli_args().get("jobs") or 1)
+    return (n_jobs,)
+
+
+@app.cell
+def _():
+    cleaned_table_names = [
+        "annual_consumption_quantity_food_beverages_tobacco",
+        "annual_gross_expenditure_by_group",
+        "employment_status_6_plus",
+        "household_appliances_access",
+        "household_distribution_by_members",
+        "household_distribution_by_number_of_employed",
+        "household_facilities_access",
+        "household_size",
+        "housing_rooms",
+    ]
+    return (cleaned_table_names,)
 
 
 @app.cell
-def _(available_tables):
-    def get_table_number_dict(table_name: str):
-        return dict(zip(
-            available_tables.get_column("Year"),
-            available_tables.get_column(table_name),
-        ))
-    return (get_table_number_dict,)
+def _(available_tables, cbi_hbs_summary, cleaned_table_names, excel_dir):
+    standard_names = cbi_hbs_summary.metadata.load("table_names")
+
+    def get_year_jobs() -> list[cbi_hbs_summary.extraction.YearJob]:
+        jobs = []
+        for row in available_tables.iter_rows(named=True):
+            year = row.pop("Year")
+            raw_tables = {name: number for name, number in row.items() if number is not None}
+            standard_tables = {
+                standard_names[name]: number
+                for name, number in raw_tables.items()
+                if standard_names.get(name) in cleaned_table_names
+            }
+            jobs.append(
+                cbi_hbs_summary.extraction.YearJob(
+                    year=year,
+                    file=excel_dir / f"{year}.xlsx",
+                    raw_tables=raw_tables,
+                    standard_tables=standard_tables,
+                )
+            )
+        return jobs
+    return (get_year_jobs,)
 
 
 @app.cell
 def _(
     cbi_hbs_summary,
     csv_dir,
-    get_table_number_dict,
-    get_year_file_reader,
-    pl,
-    re,
+    get_year_jobs,
+    manifest,
+    metadata_hash,
+    n_jobs,
+    reader_pool,
+    standard_cache_dir,
 ):
-    def extract_table_across_years(table_name: str) -> None:
-        table_number_dict = get_table_number_dict(table_name)
-        for year, table_number in table_number_dict.items():
-            if table_number is None:
-                continue
-            sheet = get_year_file_reader(year).load_sheet(table_number, header_row=None)
-            df = pl.DataFrame(sheet).cast(pl.String).select(pl.all().pipe(cbi_hbs_summary.utils.sanitize_farsi_text))
-            table_number = re.sub(r" (?P<number>\d)$", r" ۰\g<number>", table_number)
-            file_name = f"{table_number}-{table_name}".replace(" ", "_")
-            path = csv_dir/f"{year}"/f"{file_name}.csv"
-            path.parent.mkdir(exist_ok=True, parents=True)
-            df.write_csv(path, include_header=False)
-    return (extract_table_across_years,)
-
-
-@app.cell
-def _(available_tables, extract_table_across_years):
-    def extract_raw_tables():
-        for table_name in available_tables.columns[1:]:
-            extract_table_across_years(table_name)
-
-    extract_raw_tables()
-    return
+    year_jobs = get_year_jobs()
+
+    def get_year_inputs(job: cbi_hbs_summary.extraction.YearJob) -> dict[str, str]:
+        return {
+            "workbook": manifest.hash_file(job.file),
+            "metadata": metadata_hash,
+            "tables": cbi_hbs_summary.manifest.hash_value([job.raw_tables, job.standard_tables]),
+        }
+
+    stale_jobs = [
+        job for job in year_jobs
+        if not manifest.is_fresh(f"year/{job.year}", get_year_inputs(job))
+    ]
+    year_results = cbi_hbs_summary.extraction.extract_years(
+        stale_jobs,
+        csv_dir,
+        n_jobs=n_jobs,
+        reader_pool=reader_pool,
+    )
+    for job, result in zip(stale_jobs, year_results):
+        outputs = (
+            result.raw_paths
+            + cbi_hbs_summary.extraction.write_standard_cache(result, standard_cache_dir)
+        )
+        manifest.record(f"year/{job.year}", get_year_inputs(job), outputs)
+    manifest.save()
+
+    raw_table_paths = [path for result in year_results for path in result.raw_paths]
+    return raw_table_paths, year_jobs
 
 
 @app.cell
-def _(available_tables, cbi_hbs_summary, get_year_file_reader, pl, re):
-    standard_tables = available_tables.rename(cbi_hbs_summary.metadata.load("table_names"))
+def _(
+    cbi_hbs_summary,
+    cleaned_dir,
+    cleaned_table_names,
+    manifest,
+    standard_cache_dir,
+    year_jobs,
+):
+    def get_cleaned_table_inputs(table_name: str) -> dict[str, str]:
+        return {
+            str(job.year): manifest.hash_file(
+                cbi_hbs_summary.extraction.get_standard_cache_path(standard_cache_dir, job.year, table_name)
+            )
+            for job in year_jobs
+            if table_name in job.standard_tables
+        }
+
+    stale_table_names = [
+        table_name for table_name in cleaned_table_names
+        if not manifest.is_fresh(f"cleaned/{table_name}", get_cleaned_table_inputs(table_name))
+    ]
+    standard_tables = cbi_hbs_summary.extraction.merge_standard_tables(
+        cbi_hbs_summary.extraction.read_standard_cache(
+            job.year,
+            [name for name in stale_table_names if name in job.standard_tables],
+            standard_cache_dir,
+        )
+        for job in year_jobs
+    )
 
-    def get_table_numbers(table_name) -> dict:
-        return dict(zip(
-            standard_tables.get_column("Year"),
-            standard_tables.get_column(table_name),
-        ))
+    cleaned_table_paths = []
+    for table_name in stale_table_names:
+        paths = cbi_hbs_summary.storage.write_table(standard_tables[table_name], cleaned_dir / table_name)
+        manifest.record(f"cleaned/{table_name}", get_cleaned_table_inputs(table_name), paths)
+        cleaned_table_paths.extend(paths)
+    manifest.save()
+    return (cleaned_table_paths,)
 
-    def extract_standard_tables(name: str):
-        table_numbers = get_table_numbers(name)
 
-        df_list = []
-        for year, table_number in table_numbers.items():
-            if table_number is None:
-                continue
-            sheet = get_year_file_reader(year).load_sheet(table_number, header_row=None)
-            df = (
-                pl.DataFrame(sheet).cast(pl.String)
-                .select(
-                    pl.all()
-                    .pipe(cbi_hbs_summary.utils.sanitize_farsi_text)
-                    .str.replace_all(r"[\s\(\)،]", "")
-                )
-            )
-            if any(re.match(r"^\d{4}$", c) is not None for c in df.row(0)):
-                df = df.transpose()
-            rename_dict = cbi_hbs_summary.metadata.get_rename_dict(name, year)
-            columns = list(map(lambda x: rename_dict[x], df.row(0)))
-            df.columns = columns
-            df = (
-                df[1:]
-                .with_columns(pl.all().replace("", None))
-                .select(
-                    pl.lit(year).cast(pl.Int16).alias("Report_Year"),
-                    pl.col("Year").cast(pl.Int16),
-                    pl.all().exclude("Year").replace("-", None).cast(pl.Float64)
-                )
-            )
-            df_list.append(df)
-        result = pl.concat(df_list, how="diagonal")
-        return result
-    return (extract_standard_tables,)
+@app.cell
+def _(cleaned_table_paths, mo, raw_table_paths, reader_pool):
+    # Both extraction passes are done, release the workbooks
+    reader_pool.close()
+    mo.md(
+        f"Wrote {len(raw_table_paths)} raw table files and "
+        f"{len(cleaned_table_paths)} cleaned table files."
+    )
+    return
 
 
 @app.cell
-def _(cleaned_dir, extract_standard_tables):
-    for table_name in [
-        "annual_consumption_quantity_food_beverages_tobacco",
-        "annual_gross_expenditure_by_group",
-        "employment_status_6_plus",
-        "household_appliances_access",
-        "household_distribution_by_members",
-        "household_distribution_by_number_of_employed",
-        "household_facilities_access",
-        "household_size",
-        "housing_rooms",
-    ]:
-        extract_standard_tables(name=table_name).write_csv(cleaned_dir / f"{table_name}.csv")
+def _(cbi_hbs_summary, cleaned_table_paths, mo):
+    # Time and memory of each stage, recorded when CBI_HBS_TRACE is set
+    mo.stop(not cbi_hbs_summary.tracing.is_enabled())
+    cbi_hbs_summary.tracing.summary()
     return
 
 
 @app.cell
-def _(cleaned_dir, pl):
-    (
-        pl.read_csv(cleaned_dir / "annual_gross_expenditure_by_group.csv")
+def _(cbi_hbs_summary, cleaned_dir, pl):
+    normalized_expenditure = (
+        cbi_hbs_summary.storage.read_table(cleaned_dir / "annual_gross_expenditure_by_group")
         .select(
             "Report_Year", "Year",
             pl.col("Gross_Expenditure_Total").alias("Total"),
@@ -214,21 +310,27 @@ def _(cleaned_dir, pl):
             .fill_null(pl.col("Gross_Expenditure_SNA_1.1"))
             .alias("Food_and_Beverages"),
         )
-        .write_csv(cleaned_dir / f"annual_gross_expenditure_by_group_normalized.csv")
+    )
+    cbi_hbs_summary.storage.write_table(
+        normalized_expenditure,
+        cleaned_dir / "annual_gross_expenditure_by_group_normalized",
     )
     return
 
 
 @app.cell
-def _(cleaned_dir, pl):
-    (
-        pl.read_csv(cleaned_dir / "annual_gross_expenditure_by_group_normalized.csv")
+def _(cbi_hbs_summary, cleaned_dir, pl):
+    normalized_expenditure_share = (
+        cbi_hbs_summary.storage.read_table(cleaned_dir / "annual_gross_expenditure_by_group_normalized")
         .select(
             "Report_Year", "Year",
             pl.all().exclude("Report_Year", "Year")
             .truediv(pl.col("Total")).mul(100)
         )
-        .write_csv(cleaned_dir / f"annual_gross_expenditure_by_group_normalized_share.csv")
+    )
+    cbi_hbs_summary.storage.write_table(
+        normalized_expenditure_share,
+        cleaned_dir / "annual_gross_expenditure_by_group_normalized_share",
     )
     return
 
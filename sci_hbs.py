@@ -23,12 +23,13 @@ app = marimo.App(width="medium")
 def _():
     import marimo as mo
 
+    import functools
     from pathlib import Path
 
     import polars as pl
 
-    import hbsir
-    return Path, hbsir, mo, pl
+    import cbi_hbs_summary
+    return Path, cbi_hbs_summary, functools, mo, pl
 
 
 @app.cell
@@ -39,36 +40,51 @@ def _(Path):
 
 
 @app.cell
-def _(pl):
+def _(Path, cbi_hbs_summary, functools, pl):
+    @functools.cache
+    def load_cleaned_table(table_name: str) -> pl.DataFrame:
+        # Latest report of each year, read once per table
+        return cbi_hbs_summary.registry.read_cbi_table(Path("Data/Cleaned_Tables"), table_name)
+
     def get_cbi_data(table_name: str, column_name: str) -> pl.DataFrame:
         return (
-            pl.read_csv(f"Data/Cleaned_Tables/{table_name}.csv")
-            .sort("Report_Year", "Year")
-            .unique("Year", keep="last")
-            .rename({column_name: "CBI"})
-            .select("Year", "CBI")
-            .sort("Year")
-            .cast({"Year": pl.Int16})
+            load_cleaned_table(table_name)
+            .select("Year", pl.col(column_name).alias("CBI"))
         )
     return (get_cbi_data,)
 
 
 @app.cell
-def _(hbsir, pl):
-    household_properties_71 = pl.from_pandas(
-        hbsir.load_table("Weight", "71-76")
-        .pipe(hbsir.add_attribute, "Urban_Rural")
+def _(cbi_hbs_summary):
+    # Read-through Parquet cache of hbsir.load_table, set CBI_HBS_CACHE_DIR and
+    # CBI_HBS_CACHE_MAX_GB to configure it
+    hbsir_cache = cbi_hbs_summary.hbsir_cache
+    table_cache = hbsir_cache.TableCache()
+    load_table = table_cache.load_table
+    return hbsir_cache, load_table, table_cache
+
+
+@app.cell
+def _(hbsir_cache, load_table):
+    household_properties_71 = load_table(
+        "Weight", "71-76",
+        hbsir_cache.attribute("Urban_Rural"),
     )
-    household_properties_77 = pl.from_pandas(
-        hbsir.load_table("Weight", "77-03")
-        .pipe(hbsir.add_attribute, "Urban_Rural")
-        .pipe(hbsir.add_attribute, "County", aspects="cbi_sample", column_names="CBI_Sample")
+    household_properties_77 = load_table(
+        "Weight", "77-03",
+        hbsir_cache.attribute("Urban_Rural"),
+        hbsir_cache.attribute("County", aspects="cbi_sample", column_names="CBI_Sample"),
     )
     return household_properties_71, household_properties_77
 
 
 @app.cell
-def _(household_properties_71, household_properties_77, pl):
+def _(
+    household_properties_71,
+    household_properties_77,
+    pl,
+    replicate_weight_table,
+):
     household_properties = (
         pl.concat(
             [
@@ -84,36 +100,62 @@ def _(household_properties_71, household_properties_77, pl):
             }
         )
     )
+    if replicate_weight_table is not None:
+        _missing = household_properties.join(replicate_weight_table, on=["Year", "ID"], how="anti")
+        if _missing.height > 0:
+            raise ValueError(
+                f"{_missing.height} households have no replicate weights, "
+                f"e.g. {_missing.select('Year', 'ID').head(3).rows()}"
+            )
+        household_properties = household_properties.join(
+            replicate_weight_table, on=["Year", "ID"], how="left",
+        )
     return (household_properties,)
 
 
 @app.cell
-def _(household_properties, pl):
-    def create_sci_values(table: pl.DataFrame) -> pl.DataFrame:
+def _(mo, pl):
+    # Standard errors and 95% confidence intervals next to every SCI column,
+    # from bootstrap replicates, e.g. `python sci_hbs.py --replicates 200`, or
+    # from replicate weights, e.g. `python sci_hbs.py --replicate-weights
+    # weights.parquet --variance-factor 0.05`. The replicate weight file has
+    # the Year, ID and one column per replicate weight of every household.
+    replicates = mo.cli_args().get("replicates")
+    replicates = None if replicates is None else int(replicates)
+    variance_factor = mo.cli_args().get("variance-factor")
+    variance_factor = None if variance_factor is None else float(variance_factor)
+    _path = mo.cli_args().get("replicate-weights")
+    if _path is None:
+        replicate_weight_table = None
+        replicate_weights = None
+    else:
+        replicate_weight_table = pl.read_parquet(_path).cast({"Year": pl.Int16, "ID": pl.Int64})
+        replicate_weights = [c for c in replicate_weight_table.columns if c not in ("Year", "ID")]
+    return replicate_weight_table, replicate_weights, replicates, variance_factor
 
-        urban_condition = pl.col("Urban_Rural") == "Urban"
-        cbi_sample_condition = urban_condition & pl.col("CBI_Sample")
-        return (
-            household_properties
-            .join(table, on=["Year", "ID"], how="left")
-            .group_by("Year")
-            .agg(
-                pl.col(table.columns[-1]).mul(pl.col("Weight"))
-                .sum()
-                .truediv(pl.col("Weight").sum())
-                .alias("SCI_All"),
-                pl.col(table.columns[-1]).mul(pl.col("Weight"))
-                .filter(urban_condition).sum()
-                .truediv(pl.col("Weight").filter(urban_condition).sum())
-                .alias("SCI_Urban"),
-                pl.col(table.columns[-1]).mul(pl.col("Weight"))
-                .filter(cbi_sample_condition).sum()
-                .truediv(pl.col("Weight").filter(cbi_sample_condition).sum())
-                .alias("SCI_CBI_Sample"),
-            )
-            .select(pl.all().replace(0, None))
-            .fill_nan(None)
-            .sort("Year")
+
+@app.cell
+def _(
+    cbi_hbs_summary,
+    household_properties,
+    pl,
+    replicate_weights,
+    replicates,
+    variance_factor,
+):
+    def create_sci_values(
+        table: pl.DataFrame,
+        value_columns: list[str] | None = None,
+        how: str = "long",
+    ) -> pl.DataFrame:
+        return cbi_hbs_summary.sci.create_sci_values(
+            table,
+            household_properties,
+            value_columns,
+            how,
+            replicates=replicates,
+            replicate_weights=replicate_weights,
+            variance_factor=variance_factor,
         )
     return (create_sci_values,)
 
@@ -121,12 +163,51 @@ def _(household_properties, pl):
 @app.cell
 def _(Path, comparison_tables_dir):
     def get_file_path(table: str, column: str) -> Path:
-        file_path = comparison_tables_dir / f"{table}/{column}.csv"
+        # Without a suffix, the table is stored as Parquet with a CSV export
+        file_path = comparison_tables_dir / f"{table}/{column}"
         file_path.parent.mkdir(exist_ok=True, parents=True)
         return file_path
     return (get_file_path,)
 
 
+@app.cell
+def _(cbi_hbs_summary, get_file_path, pl):
+    def write_comparison_table(df: pl.DataFrame, table: str, column: str) -> None:
+        cbi_hbs_summary.storage.write_table(df, get_file_path(table, column))
+    return (write_comparison_table,)
+
+
+@app.cell
+def _(
+    cbi_hbs_summary,
+    get_cbi_data,
+    household_properties,
+    pl,
+    write_comparison_table,
+):
+    def write_distribution_comparison_tables(
+        table: pl.DataFrame,
+        column: str,
+        categories,
+        table_name: str,
+        column_prefix: str = "",
+        top: int | None = None,
+    ) -> None:
+        # The share of every category is computed in one pass, then written
+        # to one comparison table per category
+        distribution = cbi_hbs_summary.sci.create_distribution(
+            table, household_properties, column, categories, top=top,
+        )
+        for (category,), df in distribution.partition_by(
+            "Category", as_dict=True, include_key=False, maintain_order=True
+        ).items():
+            (
+                pl.concat([get_cbi_data(table_name, f"{column_prefix}{category}"), df], how="align")
+                .pipe(write_comparison_table, table_name, f"{column_prefix}{category}")
+            )
+    return (write_distribution_comparison_tables,)
+
+
 @app.cell
 def _(mo):
     mo.md(r"""
@@ -144,10 +225,10 @@ def _(mo):
 
 
 @app.cell
-def _(create_sci_values, get_cbi_data, get_file_path, hbsir, pl):
-    gross_income = pl.from_pandas(
-        hbsir.load_table("Total_Expenditure", "71-03")
-        .groupby(["Year", "ID"], as_index=False)["Gross_Expenditure"].sum()
+def _(create_sci_values, get_cbi_data, load_table, pl, write_comparison_table):
+    gross_income = (
+        load_table("Total_Expenditure", "71-03")
+        .group_by("Year", "ID").agg(pl.col("Gross_Expenditure").sum())
     )
 
     (
@@ -158,33 +239,40 @@ def _(create_sci_values, get_cbi_data, get_file_path, hbsir, pl):
             ],
             how="align",
         )
-        .write_csv(get_file_path("annual_gross_expenditure_by_group_normalized", "Total"))
+        .pipe(write_comparison_table, "annual_gross_expenditure_by_group_normalized", "Total")
     )
     return (gross_income,)
 
 
 @app.cell
-def _(hbsir, pl):
-    dfs = []
-    for y in range(1383, 1404):
-        dfs.append(
-            pl.from_pandas(
-                hbsir.load_table("Expenditures", y)
-                .pipe(
-                    hbsir.add_classification,
-                    levels=[1, 2, 3],
-                    column_names=["L1", "L2", "L3"]),
-            )
-        )
-    return (dfs,)
+def _(mo):
+    # Years of Expenditures loaded at once, e.g. `python sci_hbs.py --jobs 2`.
+    # Each worker holds one year of item level rows in memory.
+    n_jobs = int(mo.cli_args().get("jobs") or 1)
+    return (n_jobs,)
 
 
 @app.cell
-def _(dfs, pl):
+def _(hbsir_cache, n_jobs, pl, table_cache):
+    def reduce_expenditures(df: pl.DataFrame) -> pl.DataFrame:
+        return (
+            df
+            .group_by("Year", "ID", "L1").agg(pl.col("Gross_Expenditure").sum())
+            .drop_nulls()
+        )
+
+    # Each year is classified and reduced to household totals by L1 before the
+    # next one is loaded, so only the totals of the earlier years are kept
     expenditures_l1 = (
-        pl.concat(dfs, how="vertical_relaxed")
-        .group_by("Year", "ID", "L1").agg(pl.col("Gross_Expenditure").sum())
-        .drop_nulls()
+        pl.concat(
+            table_cache.map_years(
+                "Expenditures", range(1383, 1404), reduce_expenditures,
+                hbsir_cache.classification(levels=[1, 2, 3], column_names=["L1", "L2", "L3"]),
+                columns=["Year", "ID", "L1", "Gross_Expenditure"],
+                max_workers=n_jobs,
+            ),
+            how="vertical_relaxed",
+        )
         .pivot(index=["Year", "ID"], on="L1", values="Gross_Expenditure")
         .fill_null(0)
         .with_columns(pl.sum_horizontal(pl.all().exclude(["Year", "ID"])).alias("total"))
@@ -207,7 +295,13 @@ def _(create_sci_values, expenditures_l1, gross_income, pl):
 
 
 @app.cell
-def _(create_sci_values, expenditures_l1, get_cbi_data, get_file_path, pl):
+def _(
+    create_sci_values,
+    expenditures_l1,
+    get_cbi_data,
+    pl,
+    write_comparison_table,
+):
     (
         pl.concat(
             [
@@ -216,13 +310,18 @@ def _(create_sci_values, expenditures_l1, get_cbi_data, get_file_path, pl):
             ],
             how="align",
         )
-        .write_csv(get_file_path("annual_gross_expenditure_by_group_normalized", "Food_and_Beverages"))
+        .pipe(write_comparison_table, "annual_gross_expenditure_by_group_normalized", "Food_and_Beverages")
     )
     return
 
 
 @app.cell
-def _(calculate_expenditure_l1_shares, get_cbi_data, get_file_path, pl):
+def _(
+    calculate_expenditure_l1_shares,
+    get_cbi_data,
+    pl,
+    write_comparison_table,
+):
     (
         pl.concat(
             [
@@ -231,13 +330,18 @@ def _(calculate_expenditure_l1_shares, get_cbi_data, get_file_path, pl):
             ],
             how="align",
         )
-        .write_csv(get_file_path("annual_gross_expenditure_by_group_normalized_share", "Total"))
+        .pipe(write_comparison_table, "annual_gross_expenditure_by_group_normalized_share", "Total")
     )
     return
 
 
 @app.cell
-def _(calculate_expenditure_l1_shares, get_cbi_data, get_file_path, pl):
+def _(
+    calculate_expenditure_l1_shares,
+    get_cbi_data,
+    pl,
+    write_comparison_table,
+):
     (
         pl.concat(
             [
@@ -246,7 +350,7 @@ def _(calculate_expenditure_l1_shares, get_cbi_data, get_file_path, pl):
             ],
             how="align",
         )
-        .write_csv(get_file_path("annual_gross_expenditure_by_group_normalized_share", "Food_and_Beverages"))
+        .pipe(write_comparison_table, "annual_gross_expenditure_by_group_normalized_share", "Food_and_Beverages")
     )
     return
 
@@ -268,23 +372,10 @@ def _(mo):
 
 
 @app.cell
-def _(create_sci_values, get_cbi_data, get_file_path, hbsir, pl):
-    household_size = pl.from_pandas(
-        hbsir.load_table("Equivalence_Scale", "71-03")
-        .loc[:, ["Year", "ID", "Family_Size"]]
-    )
-
-    (
-        pl.concat(
-            [
-                get_cbi_data("household_size", "Household_Size_Average"),
-                create_sci_values(household_size),
-            ],
-            how="align",
-        )
-        .write_csv(get_file_path("household_size", "Household_Size_Average"))
-    )
-    return
+def _(load_table):
+    # Compared with the CBI average household size through the registry
+    household_size = load_table("Equivalence_Scale", "71-03", columns=["Year", "ID", "Family_Size"])
+    return (household_size,)
 
 
 @app.cell
@@ -296,33 +387,20 @@ def _(mo):
 
 
 @app.cell
-def _(hbsir, pl):
-    member_count = pl.from_pandas(
-        hbsir.load_table("members_properties", "71-03")
-        .groupby(["Year", "ID"])["Member_Number"].count().clip(1, 10)
-        .reset_index()
+def _(load_table, pl):
+    member_count = (
+        load_table("members_properties", "71-03")
+        .group_by("Year", "ID").agg(pl.col("Member_Number").count().clip(1, 10))
     )
     return (member_count,)
 
 
 @app.cell
-def _(create_sci_values, get_cbi_data, get_file_path, member_count, pl):
-    for i_m in range(1, 11):
-        (
-            pl.concat(
-                [
-                    get_cbi_data("household_distribution_by_members", f"Household_Size_{i_m}" + ("_plus" if i_m == 10 else "")),
-                    (
-                        create_sci_values(member_count.with_columns(pl.col("Member_Number").eq(i_m)))
-                        .with_columns(pl.col("^SCI_.*$").mul(100))
-                    ),
-                ],
-                how="align",
-            )
-            .write_csv(get_file_path(
-                "household_distribution_by_members", f"Household_Size_{i_m}" + ("_plus" if i_m == 10 else "")
-            ))
-        )
+def _(member_count, write_distribution_comparison_tables):
+    write_distribution_comparison_tables(
+        member_count, "Member_Number", range(1, 11),
+        "household_distribution_by_members", column_prefix="Household_Size_", top=10,
+    )
     return
 
 
@@ -335,15 +413,15 @@ def _(mo):
 
 
 @app.cell
-def _(hbsir):
-    hbsir.load_table("members_properties", "03")["Activity_Status"].value_counts()
+def _(load_table):
+    load_table("members_properties", "03")["Activity_Status"].value_counts()
     return
 
 
 @app.cell
-def _(hbsir, pl):
+def _(load_table, pl):
     activity_status_table = (
-        pl.from_pandas(hbsir.load_table("members_properties", "71-03"))
+        load_table("members_properties", "71-03")
         .filter(pl.col("Age").ge(6))
         .with_columns(
             pl.when(pl.col("Activity_Status").is_not_null()).then(pl.col("Activity_Status"))
@@ -356,27 +434,12 @@ def _(hbsir, pl):
 
 
 @app.cell
-def _(
-    activity_status_table,
-    create_sci_values,
-    get_cbi_data,
-    get_file_path,
-    pl,
-):
-    for a in ["Employed", "Unemployed", "Income_without_Work", "Student", "Housekeeper", "Other"]:
-        (
-            pl.concat(
-                [
-                    get_cbi_data("employment_status_6_plus", a),
-                    (
-                        create_sci_values(activity_status_table.with_columns(pl.col("Activity_Status").eq(a)))
-                        .with_columns(pl.col("^SCI_.*$").mul(100))
-                    ),
-                ],
-                how="align",
-            )
-            .write_csv(get_file_path("employment_status_6_plus", a))
-        )
+def _(activity_status_table, write_distribution_comparison_tables):
+    write_distribution_comparison_tables(
+        activity_status_table, "Activity_Status",
+        ["Employed", "Unemployed", "Income_without_Work", "Student", "Housekeeper", "Other"],
+        "employment_status_6_plus",
+    )
     return
 
 
@@ -390,26 +453,11 @@ def _(activity_status_table, pl):
 
 
 @app.cell
-def _(create_sci_values, employed_count, get_cbi_data, get_file_path, pl):
-    for i_e in range(0, 4):
-        (
-            pl.concat(
-                [
-                    get_cbi_data(
-                        "household_distribution_by_number_of_employed",
-                        f"Employed_{i_e}" + ("_plus" if i_e == 3 else "")
-                    ),
-                    (
-                        create_sci_values(employed_count.with_columns(pl.col("Employed_Count").eq(i_e)))
-                        .with_columns(pl.col("^SCI_.*$").mul(100))
-                    ),
-                ],
-                how="align",
-            )
-            .write_csv(get_file_path(
-                "household_distribution_by_number_of_employed", f"Employed_{i_e}" + ("_plus" if i_e == 3 else "")
-            ))
-        )
+def _(employed_count, write_distribution_comparison_tables):
+    write_distribution_comparison_tables(
+        employed_count, "Employed_Count", range(0, 4),
+        "household_distribution_by_number_of_employed", column_prefix="Employed_", top=3,
+    )
     return
 
 
@@ -422,417 +470,216 @@ def _(mo):
 
 
 @app.cell
-def _(hbsir, pl):
-    def get_house_specification_column_ratio(column: str | pl.Expr) -> pl.DataFrame:
-        if isinstance(column, str):
-            column = pl.col(column)
-        _columns = column.meta.root_names()
-        return (
-            pl.from_pandas(
-                hbsir.load_table("house_specifications", "71-03")
-                .loc[:, ["Year", "ID"] + _columns]
-            )
-            .with_columns(column.mul(100))
-        )
-    return (get_house_specification_column_ratio,)
-
-
-@app.cell
-def _(
-    create_sci_values,
-    get_cbi_data,
-    get_file_path,
-    get_house_specification_column_ratio,
-    pl,
-):
-    def create_house_specification_comparison_table(column: str | pl.Expr, table_name: str) -> None:
-        if isinstance(column, str):
-            column = pl.col(column)
-        (
-            pl.concat(
-                [
-                    get_cbi_data(table_name, column.meta.output_name()),
-                    create_sci_values(get_house_specification_column_ratio(column)),
-                ],
-                how="align",
-            )
-            .write_csv(get_file_path(table_name, column.meta.output_name()))
-        )
-    return (create_house_specification_comparison_table,)
-
-
-@app.cell
-def _(create_sci_values, get_house_specification_column_ratio):
-    create_sci_values(get_house_specification_column_ratio("Car"))
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Car
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Car", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Motorcycle
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Motorcycle", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(hbsir):
-    hbsir.load_table("house_specifications", "3").columns
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Bicycle
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Bicycle", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Sewing Machine
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Sewing_Machine", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Radio
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Radio", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### TV
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table, pl):
-    create_house_specification_comparison_table(
-        pl.col("Color_TV").or_(pl.col("Black_and_White_TV")).alias("TV"),
-        "household_appliances_access",
-    )
+def _(load_table):
+    load_table("house_specifications", "3").columns
     return
 
 
 @app.cell
-def _(mo):
-    mo.md(r"""
-    ### VCR
-    """)
+def _(load_table):
+    load_table("house_specifications", 1383).columns
     return
 
 
 @app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("VCR", "household_appliances_access")
-    return
+def _(pl):
+    # Indicators of house_specifications compared with each CBI table, a
+    # comparison table is written for each under its output name
+    house_specification_indicators = {
+        "household_appliances_access": [
+            "Car",
+            "Motorcycle",
+            "Bicycle",
+            "Sewing_Machine",
+            "Radio",
+            pl.col("Color_TV").or_(pl.col("Black_and_White_TV")).alias("TV"),
+            "VCR",
+            "Refrigerator",
+            pl.col("Freezer").or_(pl.col("Freezer_Refrigerator")).alias("Freezer_and_Freezer_Refrigerator"),
+            (
+                pl.col("Freezer")
+                .or_(pl.col("Refrigerator"))
+                .or_(pl.col("Freezer_Refrigerator"))
+                .alias("Refrigerator_Freezer_and_Freezer_Refrigerator")
+            ),
+            "Oven",
+            "PC",
+            "Fan",
+            "Vacuum_Cleaner",
+            "Washing_Machine",
+            "Cellphone",
+        ],
+        "household_facilities_access": [
+            "Pipe_Water",
+            "Electricity",
+            "Natural_Gas",
+            "Sewerage",
+            "Phone",
+            "Kitchen",
+            "Bathroom",
+            (
+                pl.col("Split_AC")
+                .or_(pl.col("Evaporative_AC"))
+                .or_(pl.col("Central_AC"))
+                .or_(pl.col("AC"))
+                .alias("AC")
+            ),
+            "Central_Heating",
+            "Internet",
+        ],
+        "housing_rooms": [
+            *(
+                pl.col("Number_of_Rooms").eq(room_count).alias(f"Dwelling_Room_{room_count}")
+                for room_count in range(1, 6)
+            ),
+            pl.col("Number_of_Rooms").ge(6).alias("Dwelling_Room_6_Plus"),
+        ],
+    }
+    return (house_specification_indicators,)
 
 
 @app.cell
 def _(mo):
     mo.md(r"""
-    ### Refrigerator
+    ## Comparison Registry
     """)
     return
 
 
 @app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Refrigerator", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Freezer and Freezer-Refrigerator
-    """)
-    return
+def _(cbi_hbs_summary, house_specification_indicators):
+    # Comparisons of one household indicator of one hbsir table, declared as
+    # data. Changing an indicator rewrites only its own comparison table.
+    comparisons = [
+        *(
+            cbi_hbs_summary.registry.Comparison(
+                table_name,
+                cbi_hbs_summary.sci.as_indicator(indicator).meta.output_name(),
+                "house_specifications",
+                indicator,
+                scale=100,
+            )
+            for table_name, indicators in house_specification_indicators.items()
+            for indicator in indicators
+        ),
+        cbi_hbs_summary.registry.Comparison(
+            "household_size", "Household_Size_Average", "Equivalence_Scale", "Family_Size",
+        ),
+    ]
+    return (comparisons,)
 
 
 @app.cell
-def _(create_house_specification_comparison_table, pl):
-    create_house_specification_comparison_table(
-        pl.col("Freezer").or_(pl.col("Freezer_Refrigerator")).alias("Freezer_and_Freezer_Refrigerator"),
-        "household_appliances_access",
+def _(
+    Path,
+    cbi_hbs_summary,
+    comparison_tables_dir,
+    comparisons,
+    household_properties,
+    replicate_weights,
+    replicates,
+    table_cache,
+    variance_factor,
+):
+    # Only the comparisons whose definition, source table, household
+    # properties or CBI table changed since the last run are recomputed
+    _manifest = cbi_hbs_summary.manifest.Manifest(Path("Data/.cache/comparison_manifest.json"))
+    recomputed_comparisons = cbi_hbs_summary.registry.run(
+        comparisons,
+        household_properties,
+        table_cache,
+        Path("Data/Cleaned_Tables"),
+        comparison_tables_dir,
+        _manifest,
+        replicates,
+        replicate_weights,
+        variance_factor,
     )
+    [c.key for c in recomputed_comparisons]
     return
 
 
 @app.cell
 def _(mo):
     mo.md(r"""
-    ### Freezer and Refrigerator
+    ## Household Cube
     """)
     return
 
 
 @app.cell
-def _(create_house_specification_comparison_table, pl):
-    create_house_specification_comparison_table(
-        pl.col("Freezer")
-        .or_(pl.col("Refrigerator"))
-        .or_(pl.col("Freezer_Refrigerator"))
-        .alias("Refrigerator_Freezer_and_Freezer_Refrigerator"),
-        "household_appliances_access",
+def _(
+    Path,
+    cbi_hbs_summary,
+    employed_count,
+    expenditures_l1,
+    gross_income,
+    house_specification_indicators,
+    household_properties,
+    household_size,
+    load_table,
+    pl,
+):
+    # Every household indicator in one table partitioned by year, so new
+    # comparisons scan its columns instead of reloading and joining hbsir tables
+    _indicators = [i for indicators in house_specification_indicators.values() for i in indicators]
+    household_cube = cbi_hbs_summary.cube.build_cube(
+        household_properties.select("Year", "ID", "Weight", "Urban_Rural", "CBI_Sample"),
+        [
+            household_size,
+            (
+                load_table("members_properties", "71-03", columns=["Year", "ID", "Member_Number"])
+                .group_by("Year", "ID").agg(pl.col("Member_Number").count().alias("Member_Count"))
+            ),
+            employed_count,
+            gross_income,
+            expenditures_l1.select("Year", "ID", pl.exclude("Year", "ID").name.prefix("Expenditure_")),
+            cbi_hbs_summary.sci.evaluate_indicators(
+                load_table(
+                    "house_specifications", "71-03",
+                    columns=["Year", "ID", *cbi_hbs_summary.sci.get_root_columns(_indicators)],
+                ),
+                _indicators,
+            ),
+        ],
     )
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Oven
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Oven", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### PC
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("PC", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Fan
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Fan", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Vacuum Cleaner
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Vacuum_Cleaner", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Washing Machine
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Washing_Machine", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Cellphone
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Cellphone", "household_appliances_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Pipe Water
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Pipe_Water", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Electricity
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Electricity", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(mo):
-    mo.md(r"""
-    ### Natural_Gas
-    """)
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Natural_Gas", "household_facilities_access")
-    return
+    cbi_hbs_summary.cube.write_cube(household_cube, Path("Data/Household_Cube"))
+    return (household_cube,)
 
 
 @app.cell
 def _(mo):
     mo.md(r"""
-    ### Sewerage
+    ## Household Distributions
     """)
     return
 
 
 @app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Sewerage", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Phone", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Kitchen", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Bathroom", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(hbsir):
-    hbsir.load_table("house_specifications", 1383).columns
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table, pl):
-    create_house_specification_comparison_table(
-        pl.col("Split_AC")
-        .or_(pl.col("Evaporative_AC"))
-        .or_(pl.col("Central_AC"))
-        .or_(pl.col("AC"))
-        .alias("AC"),
-        "household_facilities_access",
-    )
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Central_Heating", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table):
-    create_house_specification_comparison_table("Internet", "household_facilities_access")
-    return
-
-
-@app.cell
-def _(create_house_specification_comparison_table, pl):
-    for room_count in range(1, 6):
-        create_house_specification_comparison_table(
-            pl.col("Number_of_Rooms").eq(room_count).alias(f"Dwelling_Room_{room_count}"),
-            "housing_rooms",
+def _(Path, cbi_hbs_summary, expenditures_l1, household_properties, household_size):
+    # Deciles and decile shares of household expenditure and size, one sort
+    # per indicator for every year, segment and quantile. Each file holds one
+    # indicator, so the Indicator column is dropped and the rest is numeric
+    _distributions_dir = Path("Data/Household_Distributions")
+    for _table, _column in [(expenditures_l1, "total"), (household_size, "Family_Size")]:
+        cbi_hbs_summary.storage.write_table(
+            cbi_hbs_summary.sci.create_quantiles(
+                _table, household_properties, [_column], [i / 10 for i in range(1, 10)],
+            ).drop("Indicator"),
+            _distributions_dir / f"{_column}_Deciles",
+        )
+        cbi_hbs_summary.storage.write_table(
+            cbi_hbs_summary.sci.create_shares(_table, household_properties, [_column]).drop("Indicator"),
+            _distributions_dir / f"{_column}_Decile_Shares",
         )
-    create_house_specification_comparison_table(
-        pl.col("Number_of_Rooms").ge(6).alias(f"Dwelling_Room_6_Plus"),
-        "housing_rooms",
-    )
     return
 
 
 @app.cell
-def _(hbsir):
+def _(hbsir_cache, load_table):
     (
-        hbsir.load_table("house_specifications", "71-3")
-        .pipe(hbsir.add_weight)
+        load_table("house_specifications", "71-3", hbsir_cache.weight())
+        .to_pandas()
         .groupby(["Year", "Number_of_Rooms"])["Weight"].sum()
         .unstack()
         .drop(columns=[0])
@@ -997,6 +844,7 @@ def _(column, fig, include_zero, log_scale, mo, table):
 
 @app.cell
 def _(
+    cbi_hbs_summary,
     column,
     get_file_path,
     include_zero,
@@ -1011,7 +859,7 @@ def _(
     title = title_mapping.get((table.value, column.value), column.value)
 
     plot_table = (
-        pl.read_csv(get_file_path(table.value, column.value))
+        cbi_hbs_summary.storage.read_table(get_file_path(table.value, column.value))
         .unpivot(index="Year", variable_name="Source", value_name="Value")
         .with_columns(pl.col("Source").str.replace_all("_", " "))
         .cast({"Source": pl.Enum(["SCI All", "SCI Urban", "SCI CBI Sample", "CBI"])})
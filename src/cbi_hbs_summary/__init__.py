@@ -1,7 +1,20 @@
-from . import metadata, utils
+from . import bundle, cube, extraction, hbsir_cache, manifest, metadata, readers, registry, sci, search, segments, static_data, storage, tracing, utils
 
 
 __all__ = [
+    "bundle",
+    "cube",
+    "extraction",
+    "hbsir_cache",
+    "manifest",
     "metadata",
+    "readers",
+    "registry",
+    "sci",
+    "search",
+    "segments",
+    "static_data",
+    "storage",
+    "tracing",
     "utils",
 ]
@@ -0,0 +1,100 @@
+"""
+Every comparison table packed into one file for the app.
+
+The app runs in the browser, where each comparison table was a separate HTTP
+request. The bundle is a single table with the Table, Column and Year of every
+row of every comparison, followed by the source columns (CBI, SCI_All, ...).
+It is written as CSV, with values rounded to `FLOAT_PRECISION` decimals, and
+as full precision Parquet, next to a manifest listing the columns of each
+table and the hash of each file:
+
+    python -m cbi_hbs_summary.bundle
+"""
+
+import argparse
+import io
+import json
+from pathlib import Path
+
+import polars as pl
+
+from . import storage, tracing
+from .manifest import hash_bytes, write_if_changed
+
+
+BUNDLE_NAME = "comparisons"
+MANIFEST_NAME = "manifest.json"
+
+FLOAT_PRECISION = 4
+
+KEYS = {"Table": pl.String, "Column": pl.String, "Year": pl.Int16}
+
+
+def read_comparison_tables(directory: str | Path) -> pl.DataFrame:
+    """
+    The `<table>/<column>` comparison tables under `directory` stacked in one
+    table, with the union of their source columns.
+    """
+    directory = Path(directory)
+    paths = sorted({p.with_suffix("") for p in directory.glob("*/*") if p.suffix in (".csv", ".parquet")})
+    frames = [
+        storage.read_table(path).select(
+            pl.lit(path.parent.name).alias("Table"),
+            pl.lit(path.name).alias("Column"),
+            pl.all(),
+        )
+        for path in paths
+    ]
+    if not frames:
+        return pl.DataFrame(schema=KEYS)
+    return pl.concat(frames, how="diagonal_relaxed")
+
+
+def build_bundle(comparison_dir: str | Path, output_dir: str | Path) -> dict:
+    """
+    Write the bundle of the comparison tables and its manifest to
+    `output_dir`, leaving unchanged files untouched, and return the manifest.
+    """
+    output_dir = Path(output_dir)
+    with tracing.span("build_bundle") as span:
+        bundle = read_comparison_tables(comparison_dir)
+        span["rows"] = bundle.height
+
+        buffer = io.BytesIO()
+        bundle.write_parquet(buffer)
+        contents = {
+            f"{BUNDLE_NAME}.csv": bundle.write_csv(float_precision=FLOAT_PRECISION).encode(),
+            f"{BUNDLE_NAME}.parquet": buffer.getvalue(),
+        }
+        tables = bundle.select("Table", "Column").unique(maintain_order=True)
+        manifest = {
+            "rows": bundle.height,
+            "tables": {
+                table: columns
+                for table, columns in tables.group_by("Table", maintain_order=True).agg("Column").iter_rows()
+            },
+            "files": {
+                name: {"size": len(content), "sha256": hash_bytes(content)}
+                for name, content in contents.items()
+            },
+        }
+        for name, content in contents.items():
+            write_if_changed(output_dir / name, content)
+        write_if_changed(
+            output_dir / MANIFEST_NAME,
+            json.dumps(manifest, indent=2, ensure_ascii=False).encode(),
+        )
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comparison-dir", type=Path, default=Path("Data/Comparison_Tables"))
+    parser.add_argument("--output-dir", type=Path, default=Path("Data/Comparison_Bundle"))
+    args = parser.parse_args()
+    manifest = build_bundle(args.comparison_dir, args.output_dir)
+    print(f"{manifest['rows']:,} rows of {sum(map(len, manifest['tables'].values()))} comparison tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Household level analysis cube.
+
+One row per household with its Year, ID, Weight, Urban_Rural and CBI_Sample
+and every derived household indicator, stored as Parquet partitioned by year
+(`<directory>/Year=<year>/households.parquet`). A comparison over the cube is
+a scan of the needed columns and a weighted `group_by`, see
+`sci.aggregate_sci_values`.
+"""
+
+from collections.abc import Iterable
+import io
+from pathlib import Path
+
+import polars as pl
+
+from . import tracing
+from .manifest import write_if_changed
+
+
+KEYS = ["Year", "ID"]
+
+FILE_NAME = "households.parquet"
+
+
+def _cast_keys(df: pl.DataFrame) -> pl.DataFrame:
+    return df.cast({"Year": pl.Int16, "ID": pl.Int64})
+
+
+def build_cube(household_properties: pl.DataFrame, tables: Iterable[pl.DataFrame]) -> pl.DataFrame:
+    """
+    Left join household level tables, keyed by Year and ID, to the household
+    properties.
+
+    Each table must have at most one row per household, and no column other
+    than Year and ID may appear in two tables.
+    """
+    cube = _cast_keys(household_properties)
+    for table in tables:
+        duplicates = set(table.columns).intersection(cube.columns).difference(KEYS)
+        if duplicates:
+            raise ValueError(f"Columns already in the cube: {sorted(duplicates)}")
+        if table.select(KEYS).is_duplicated().any():
+            raise ValueError(f"{table.columns} has more than one row per household")
+        cube = cube.join(_cast_keys(table), on=KEYS, how="left")
+    return cube.sort(KEYS)
+
+
+def get_partition_path(directory: str | Path, year: int) -> Path:
+    return Path(directory) / f"Year={year}" / FILE_NAME
+
+
+def write_cube(cube: pl.DataFrame, directory: str | Path) -> list[Path]:
+    """
+    Write one Parquet file per year. Years whose content did not change are
+    left untouched, and partitions of years no longer in the cube are removed.
+    """
+    directory = Path(directory)
+    paths = []
+    with tracing.span("write_cube", rows=cube.height, columns=cube.width):
+        for (year,), partition in cube.partition_by("Year", as_dict=True, include_key=False).items():
+            buffer = io.BytesIO()
+            partition.write_parquet(buffer)
+            path = get_partition_path(directory, year)
+            write_if_changed(path, buffer.getvalue())
+            paths.append(path)
+    for path in set(directory.glob(f"Year=*/{FILE_NAME}")).difference(paths):
+        path.unlink()
+    return paths
+
+
+def scan_cube(directory: str | Path) -> pl.LazyFrame:
+    """
+    Lazy frame over every year of the cube, with Year read from the partition
+    names.
+    """
+    return pl.scan_parquet(
+        Path(directory) / "**" / FILE_NAME,
+        hive_partitioning=True,
+        hive_schema={"Year": pl.Int16},
+        missing_columns="insert",
+    )
@@ -0,0 +1,188 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import multiprocessing
+from pathlib import Path
+import re
+
+import fastexcel
+import polars as pl
+
+from . import metadata, tracing, utils
+from .manifest import write_if_changed
+from .readers import ReaderPool
+
+
+@dataclass(frozen=True)
+class YearJob:
+    """
+    Everything needed to extract the tables of one yearly workbook.
+
+    `raw_tables` maps the Farsi table name to its sheet name and `standard_tables`
+    maps the standard table name to its sheet name.
+    """
+    year: int
+    file: Path
+    raw_tables: dict[str, str] = field(default_factory=dict)
+    standard_tables: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class YearResult:
+    year: int
+    raw_paths: list[Path]
+    standard_tables: dict[str, pl.DataFrame]
+
+
+def get_raw_table_path(csv_dir: Path, year: int, table_number: str, table_name: str) -> Path:
+    table_number = re.sub(r" (?P<number>\d)$", r" ۰\g<number>", table_number)
+    file_name = f"{table_number}-{table_name}".replace(" ", "_")
+    return csv_dir / f"{year}" / f"{file_name}.csv"
+
+
+def load_sheet(reader: fastexcel.ExcelReader, table_number: str) -> pl.DataFrame:
+    """
+    Load a sheet without a header row through the Arrow interface of fastexcel.
+    """
+    with tracing.span("load_sheet", sheet=table_number) as span:
+        sheet = reader.load_sheet(table_number, header_row=None)
+        df = pl.from_arrow(sheet.to_arrow(), rechunk=False)
+        span["rows"] = df.height
+    return df
+
+
+def clean_raw_sheet(sheet: pl.DataFrame) -> pl.DataFrame:
+    with tracing.span("sanitize", rows=sheet.height, columns=sheet.width):
+        return sheet.cast(pl.String).select(pl.all().pipe(utils.sanitize_farsi_text))
+
+
+def standardize_sheet(raw_sheet: pl.DataFrame, name: str, year: int) -> pl.DataFrame:
+    """
+    Build the standardized table from a sheet already cleaned by `clean_raw_sheet`.
+    """
+    with tracing.span("standardize_sheet", table=name, year=year, rows=raw_sheet.height):
+        return _standardize_sheet(raw_sheet, name, year)
+
+
+def _standardize_sheet(raw_sheet: pl.DataFrame, name: str, year: int) -> pl.DataFrame:
+    df = raw_sheet.select(pl.all().str.replace_all(utils.LABEL_SEPARATORS_PATTERN, ""))
+    if any(re.match(r"^\d{4}$", c) is not None for c in df.row(0)):
+        df = df.transpose()
+    rename_dict = metadata.get_rename_dict(name, year)
+    columns = list(map(lambda x: rename_dict[x], df.row(0)))
+    df.columns = columns
+    return (
+        df[1:]
+        .with_columns(pl.all().replace("", None))
+        .select(
+            pl.lit(year).cast(pl.Int16).alias("Report_Year"),
+            pl.col("Year").cast(pl.Int16),
+            pl.all().exclude("Year").replace("-", None).cast(pl.Float64)
+        )
+    )
+
+
+def extract_year(job: YearJob, csv_dir: Path, reader_pool: ReaderPool | None = None) -> YearResult:
+    """
+    Write the raw CSV files of one workbook and return its standardized tables.
+
+    Each sheet is loaded and cleaned once, and both the raw CSV file and the
+    standardized frame are built from that single copy.
+    """
+    with tracing.span("extract_year", year=job.year):
+        return _extract_year(job, csv_dir, reader_pool)
+
+
+def _extract_year(job: YearJob, csv_dir: Path, reader_pool: ReaderPool | None) -> YearResult:
+    with tracing.span("open_workbook", year=job.year):
+        if reader_pool is None:
+            reader = fastexcel.read_excel(job.file)
+        else:
+            reader = reader_pool.get(job.file)
+
+    raw_names: dict[str, list[str]] = {}
+    standard_names: dict[str, list[str]] = {}
+    for table_name, table_number in job.raw_tables.items():
+        raw_names.setdefault(table_number, []).append(table_name)
+    for name, table_number in job.standard_tables.items():
+        standard_names.setdefault(table_number, []).append(name)
+
+    raw_paths = []
+    standard_tables = {}
+    for table_number in dict.fromkeys([*raw_names, *standard_names]):
+        raw_sheet = clean_raw_sheet(load_sheet(reader, table_number))
+        for table_name in raw_names.get(table_number, []):
+            path = get_raw_table_path(csv_dir, job.year, table_number, table_name)
+            with tracing.span("write_csv", rows=raw_sheet.height):
+                write_if_changed(path, raw_sheet.write_csv(include_header=False).encode())
+            raw_paths.append(path)
+        for name in standard_names.get(table_number, []):
+            standard_tables[name] = standardize_sheet(raw_sheet, name, job.year)
+    standard_tables = {name: standard_tables[name] for name in job.standard_tables}
+    return YearResult(job.year, raw_paths, standard_tables)
+
+
+def extract_years(
+    jobs: list[YearJob],
+    csv_dir: Path,
+    *,
+    n_jobs: int = 1,
+    reader_pool: ReaderPool | None = None,
+) -> list[YearResult]:
+    """
+    Extract every yearly workbook, one process per workbook when `n_jobs > 1`.
+
+    Each worker writes the raw CSV files of its own year. Results are returned
+    in the order of `jobs`, so merging them does not depend on `n_jobs` or on
+    which worker finishes first.
+    """
+    if n_jobs > 1 and len(jobs) > 1:
+        # Forking a process that already started the Polars thread pool can deadlock
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp_context) as executor:
+            results = []
+            for result, events in executor.map(_extract_year_in_worker, jobs, [csv_dir] * len(jobs)):
+                tracing.add_events(events)
+                results.append(result)
+            return results
+    return [extract_year(job, csv_dir, reader_pool) for job in jobs]
+
+
+def _extract_year_in_worker(job: YearJob, csv_dir: Path) -> tuple[YearResult, list[dict]]:
+    # The spans recorded in the worker are handed back to the parent process
+    result = extract_year(job, csv_dir)
+    return result, tracing.collect()
+
+
+def merge_standard_tables(frames: Iterable[dict[str, pl.DataFrame]]) -> dict[str, pl.DataFrame]:
+    """
+    Concatenate the per year standardized frames, keeping the order of `frames`.
+    """
+    df_lists: dict[str, list[pl.DataFrame]] = {}
+    for year_frames in frames:
+        for name, df in year_frames.items():
+            df_lists.setdefault(name, []).append(df)
+    return {
+        name: pl.concat(df_list, how="diagonal")
+        for name, df_list in df_lists.items()
+    }
+
+
+def get_standard_cache_path(cache_dir: Path, year: int, name: str) -> Path:
+    return cache_dir / f"{year}" / f"{name}.arrow"
+
+
+def write_standard_cache(result: YearResult, cache_dir: Path) -> list[Path]:
+    paths = []
+    for name, df in result.standard_tables.items():
+        path = get_standard_cache_path(cache_dir, result.year, name)
+        write_if_changed(path, df.write_ipc(None).getvalue())
+        paths.append(path)
+    return paths
+
+
+def read_standard_cache(year: int, names: Iterable[str], cache_dir: Path) -> dict[str, pl.DataFrame]:
+    return {
+        name: pl.read_ipc(get_standard_cache_path(cache_dir, year, name), memory_map=False)
+        for name in names
+    }
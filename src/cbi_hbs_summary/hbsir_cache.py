@@ -0,0 +1,219 @@
+"""
+Read-through Parquet cache of `hbsir.load_table` results.
+
+A cached table is keyed by the table name, the parsed years, the
+`add_attribute`/`add_classification`/`add_weight` steps applied to it, the
+hbsir version and the local hbsir metadata of this package. The directory
+defaults to `CBI_HBS_CACHE_DIR` (or `Data/.cache/hbsir`) and is kept below
+`CBI_HBS_CACHE_MAX_GB` gigabytes by evicting the least recently used files.
+Hits are read memory-mapped, without going through pandas.
+"""
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cache
+import importlib.metadata
+import os
+from pathlib import Path
+from typing import Literal
+
+import polars as pl
+
+from . import tracing
+from .manifest import hash_bytes, hash_value
+
+
+DEFAULT_DIRECTORY = Path("Data/.cache/hbsir")
+DEFAULT_MAX_SIZE_GB = 20.0
+
+_STEP = Literal["add_attribute", "add_classification", "add_weight"]
+
+
+@dataclass(frozen=True)
+class Step:
+    """
+    One hbsir function applied to the loaded table, with its arguments.
+    """
+    function: _STEP
+    args: tuple = ()
+    kwargs: tuple[tuple[str, object], ...] = ()
+
+    def apply(self, table):
+        import hbsir
+
+        return getattr(hbsir, self.function)(table, *self.args, **dict(self.kwargs))
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def attribute(name: str, **kwargs) -> Step:
+    """
+    Step for `hbsir.add_attribute(table, name, **kwargs)`.
+    """
+    return Step("add_attribute", (name,), tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+
+
+def classification(target: str | None = None, **kwargs) -> Step:
+    """
+    Step for `hbsir.add_classification(table, target, **kwargs)`.
+    """
+    args = () if target is None else (target,)
+    return Step("add_classification", args, tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+
+
+def weight() -> Step:
+    """
+    Step for `hbsir.add_weight(table)`.
+    """
+    return Step("add_weight")
+
+
+def _parse_years(years) -> list[int] | str:
+    # "all" and "last" depend on what is available and are kept as given
+    if isinstance(years, str) and years in ("all", "last"):
+        return years
+    from bssir.utils import parse_years
+
+    return parse_years(years)
+
+
+@cache
+def _get_environment_key() -> str:
+    """
+    Hash of what a cached table depends on besides its arguments.
+    """
+    metadata_dir = Path(__file__).parent.joinpath("metadata", "hbsir")
+    return hash_value({
+        "hbsir": importlib.metadata.version("hbsir"),
+        "metadata": {
+            path.relative_to(metadata_dir).as_posix(): hash_bytes(path.read_bytes())
+            for path in sorted(metadata_dir.rglob("*.yaml"))
+        },
+    })
+
+
+class TableCache:
+    """
+    Parquet files of loaded hbsir tables, one file per distinct request.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path | None = None,
+        max_size_gb: float | None = None,
+    ) -> None:
+        self.directory = Path(directory or os.environ.get("CBI_HBS_CACHE_DIR") or DEFAULT_DIRECTORY)
+        if max_size_gb is None:
+            max_size_gb = float(os.environ.get("CBI_HBS_CACHE_MAX_GB") or DEFAULT_MAX_SIZE_GB)
+        self.max_size = int(max_size_gb * 2**30)
+
+    def get_path(self, table_name: str, years, steps: Iterable[Step] = (), **kwargs) -> Path:
+        key = hash_value({
+            "table_name": table_name,
+            "years": _parse_years(years),
+            "steps": [[s.function, list(s.args), [list(kv) for kv in s.kwargs]] for s in steps],
+            "kwargs": kwargs,
+            "environment": _get_environment_key(),
+        })
+        return self.directory / f"{table_name}-{key[:24]}.parquet"
+
+    def load_table(
+        self,
+        table_name: str,
+        years,
+        *steps: Step,
+        columns: list[str] | None = None,
+        **kwargs,
+    ) -> pl.DataFrame:
+        """
+        `hbsir.load_table(table_name, years, **kwargs)` with `steps` applied,
+        as a Polars frame, read from the cache when the same request was made
+        before.
+
+        With `columns`, only those columns are read from the cached file.
+        """
+        path = self.get_path(table_name, years, steps, **kwargs)
+        with tracing.span("hbsir.load_table", table=table_name, years=str(years)) as span:
+            if path.exists():
+                span["cache"] = "hit"
+                # Mark as recently used for the eviction
+                path.touch()
+                df = pl.read_parquet(path, columns=columns, memory_map=True)
+            else:
+                span["cache"] = "miss"
+                df = self._load(table_name, years, steps, **kwargs)
+                self._write(df, path)
+                if columns is not None:
+                    df = df.select(columns)
+            span["rows"] = df.height
+        return df
+
+    def map_years(
+        self,
+        table_name: str,
+        years: Iterable[int],
+        function: Callable[[pl.DataFrame], pl.DataFrame],
+        *steps: Step,
+        columns: list[str] | None = None,
+        max_workers: int = 1,
+        **kwargs,
+    ) -> list[pl.DataFrame]:
+        """
+        Load the table one year at a time and return `function` of each year,
+        in the order of `years`.
+
+        Only the reduced frames are kept, so at most `max_workers` full years
+        are in memory at once. With more than one worker, the years are loaded
+        by a thread pool.
+        """
+        def load_year(year: int) -> pl.DataFrame:
+            with tracing.span("map_years", table=table_name, year=year):
+                return function(self.load_table(table_name, year, *steps, columns=columns, **kwargs))
+
+        if max_workers <= 1:
+            return [load_year(year) for year in years]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(load_year, years))
+
+    def _load(self, table_name: str, years, steps: Iterable[Step], **kwargs) -> pl.DataFrame:
+        import hbsir
+
+        table = hbsir.load_table(table_name, years, **kwargs)
+        for step in steps:
+            table = step.apply(table)
+        return pl.from_pandas(table)
+
+    def _write(self, df: pl.DataFrame, path: Path) -> None:
+        self.directory.mkdir(exist_ok=True, parents=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        df.write_parquet(temp_path)
+        temp_path.replace(path)
+        self.evict()
+
+    def evict(self) -> list[Path]:
+        """
+        Delete the least recently used files until the cache fits its size.
+        """
+        files = sorted(
+            ((p, p.stat()) for p in self.directory.glob("*.parquet")),
+            key=lambda item: item[1].st_mtime_ns,
+        )
+        size = sum(stat.st_size for _, stat in files)
+        evicted = []
+        # The newest file is kept even when it is larger than the limit on its own
+        for path, stat in files[:-1]:
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+            evicted.append(path)
+        return evicted
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.parquet"):
+            path.unlink(missing_ok=True)
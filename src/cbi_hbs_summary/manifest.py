@@ -0,0 +1,106 @@
+from collections.abc import Iterable
+import hashlib
+import json
+from pathlib import Path
+
+import polars as pl
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_value(value) -> str:
+    """
+    Hash any JSON serializable value, independent of dictionary order.
+    """
+    return hash_bytes(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode())
+
+
+def hash_frame(df: pl.DataFrame) -> str:
+    """
+    Hash of the schema and rows of a frame. Row hashes are only stable within
+    a Polars version, which is part of the hash.
+    """
+    digest = hashlib.sha256(hash_value([pl.__version__, {k: str(v) for k, v in df.schema.items()}]).encode())
+    digest.update(df.hash_rows(seed=0).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def write_if_changed(path: str | Path, data: bytes) -> bool:
+    """
+    Write `data` to `path` unless the file already has exactly this content.
+    """
+    path = Path(path)
+    if path.exists() and path.stat().st_size == len(data) and path.read_bytes() == data:
+        return False
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_bytes(data)
+    return True
+
+
+class Manifest:
+    """
+    Content hashes of the inputs and outputs of each pipeline step.
+
+    A step (node) is fresh when its input hashes match the ones recorded in the
+    last run and all of its recorded outputs still exist unchanged. File hashes
+    are cached by size and modification time, so unchanged files are not read
+    again.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        if self.path.exists():
+            content = json.loads(self.path.read_text(encoding="utf-8"))
+        else:
+            content = {}
+        self.files: dict[str, dict] = content.get("files", {})
+        self.nodes: dict[str, dict] = content.get("nodes", {})
+
+    def hash_file(self, path: str | Path) -> str:
+        path = Path(path)
+        stat = path.stat()
+        key = path.as_posix()
+        cached = self.files.get(key)
+        if (
+            cached is not None
+            and cached["size"] == stat.st_size
+            and cached["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with path.open("rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        self.files[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest.hexdigest(),
+        }
+        return digest.hexdigest()
+
+    def hash_files(self, paths: Iterable[str | Path]) -> str:
+        return hash_value({Path(p).as_posix(): self.hash_file(p) for p in paths})
+
+    def is_fresh(self, node: str, inputs: dict[str, str]) -> bool:
+        record = self.nodes.get(node)
+        if record is None or record["inputs"] != inputs:
+            return False
+        for output, output_hash in record["outputs"].items():
+            if not Path(output).exists() or self.hash_file(output) != output_hash:
+                return False
+        return True
+
+    def record(self, node: str, inputs: dict[str, str], outputs: Iterable[str | Path] = ()) -> None:
+        self.nodes[node] = {
+            "inputs": inputs,
+            "outputs": {Path(p).as_posix(): self.hash_file(p) for p in outputs},
+        }
+
+    def save(self) -> None:
+        files = {k: v for k, v in self.files.items() if Path(k).exists()}
+        content = {"files": files, "nodes": self.nodes}
+        data = json.dumps(content, indent=2, sort_keys=True, ensure_ascii=False).encode()
+        write_if_changed(self.path, data)
@@ -1,11 +1,25 @@
-from typing import Literal
+from bisect import bisect_right
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import cache
+import hashlib
+import os
 from pathlib import Path
+import pickle
+from types import MappingProxyType
+from typing import Literal
 
 import yaml
 
+from .. import utils
+
 
 _METADATA = Literal["table_names", "column_names"]
 
+# Bump when the layout of the compiled column names cache changes
+_CACHE_VERSION = 1
+
+
 def load(name: _METADATA) -> dict:
     file_path = Path(__file__).parent.joinpath(f"{name}.yaml")
     with file_path.open(encoding="utf-8") as file:
@@ -13,22 +27,100 @@ def load(name: _METADATA) -> dict:
     return metadata
 
 
-def get_rename_dict(table_name: str, year: int | None) -> dict[str, str]:
-    metadata = load("column_names")
-    table_column_names = metadata[table_name]
-    if all(isinstance(k, int) for k in table_column_names.keys()):
-        assert year is not None
-        version = max(filter(lambda y: y <= year, table_column_names.keys()))
-        table_column_names = table_column_names[version]
-    if "_general" in metadata:
-        table_column_names.update(metadata["_general"])
-    rename_dict = {_sanitize_farsi_text(k): v for k, v in table_column_names.items()}
-    return rename_dict
+@dataclass(frozen=True)
+class _TableColumns:
+    """
+    Rename dictionaries of one table, with sanitized keys.
+
+    `versions` holds the sorted first years of each version and is empty for
+    tables whose column names do not change over the years.
+    """
+    versions: tuple[int, ...]
+    rename_dicts: tuple[Mapping[str, str], ...]
+
+
+def get_rename_dict(table_name: str, year: int | None) -> Mapping[str, str]:
+    table = _get_column_index()[table_name]
+    if not table.versions:
+        return table.rename_dicts[0]
+    assert year is not None
+    position = bisect_right(table.versions, year) - 1
+    if position < 0:
+        raise ValueError(f"{table_name} has no column names for {year}")
+    return table.rename_dicts[position]
+
+
+@cache
+def _get_column_index() -> Mapping[str, _TableColumns]:
+    compiled = _load_compiled_column_names()
+    return MappingProxyType({
+        table_name: _TableColumns(
+            versions=tuple(versions),
+            rename_dicts=tuple(MappingProxyType(d) for d in rename_dicts),
+        )
+        for table_name, (versions, rename_dicts) in compiled.items()
+    })
+
+
+def _load_compiled_column_names() -> dict[str, tuple[list[int], list[dict[str, str]]]]:
+    """
+    Read the compiled column names from the cache next to the YAML file,
+    compiling and caching them again when the YAML file or the sanitization
+    rules have changed.
+    """
+    yaml_path = Path(__file__).parent.joinpath("column_names.yaml")
+    cache_path = yaml_path.with_name(".column_names.pickle")
+    content = yaml_path.read_bytes()
+    key = hashlib.sha256(
+        repr((
+            _CACHE_VERSION,
+            content,
+            utils.CHARACTER_MAPPING,
+            utils.WHITESPACE_PATTERN,
+            utils.LABEL_SEPARATORS_PATTERN,
+        )).encode()
+    ).hexdigest()
+
+    try:
+        with cache_path.open("rb") as file:
+            cached_key, compiled = pickle.load(file)
+        if cached_key == key:
+            return compiled
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+
+    compiled = _compile_column_names(yaml.safe_load(content.decode("utf-8")))
+    try:
+        temp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}")
+        with temp_path.open("wb") as file:
+            pickle.dump((key, compiled), file)
+        temp_path.replace(cache_path)
+    except OSError:
+        # The package directory may be read-only, the cache is optional
+        pass
+    return compiled
+
+
+def _compile_column_names(metadata: dict) -> dict[str, tuple[list[int], list[dict[str, str]]]]:
+    general = metadata.get("_general", {})
+    compiled = {}
+    for table_name, table_column_names in metadata.items():
+        if table_name == "_general":
+            continue
+        if table_column_names and all(isinstance(k, int) for k in table_column_names.keys()):
+            versions = sorted(table_column_names.keys())
+            versioned_names = [table_column_names[v] for v in versions]
+        else:
+            versions = []
+            versioned_names = [table_column_names]
+        rename_dicts = [
+            {_sanitize_farsi_text(k): v for k, v in {**names, **general}.items()}
+            for names in versioned_names
+        ]
+        compiled[table_name] = (versions, rename_dicts)
+    return compiled
 
 
 def _sanitize_farsi_text(text: str) -> str:
-    return (
-        text
-        .replace(" ", "")
-        .replace("،", "")
-    )
+    # Same normalization the extraction applies to the table labels
+    return utils.sanitize_farsi_label_string(text)
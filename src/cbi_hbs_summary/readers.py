@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import fastexcel
+
+
+class ReaderPool:
+    """
+    Reuse opened Excel workbooks so each file is parsed once per run.
+
+    Readers are keyed by the resolved path and the modification time of the file,
+    so a workbook that changes on disk is reopened. At most `maxsize` readers are
+    kept and the least recently used one is dropped when the pool is full.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._readers: OrderedDict[tuple[Path, int], fastexcel.ExcelReader] = OrderedDict()
+
+    def get(self, path: str | Path) -> fastexcel.ExcelReader:
+        path = Path(path).resolve()
+        key = (path, path.stat().st_mtime_ns)
+        reader = self._readers.get(key)
+        if reader is not None:
+            self._readers.move_to_end(key)
+            return reader
+
+        # Drop readers of older versions of the same file
+        for stale_key in [k for k in self._readers if k[0] == path]:
+            del self._readers[stale_key]
+
+        reader = fastexcel.read_excel(path)
+        self._readers[key] = reader
+        while len(self._readers) > self.maxsize:
+            self._readers.popitem(last=False)
+        return reader
+
+    def close(self) -> None:
+        """
+        Release every pooled reader.
+        """
+        self._readers.clear()
+
+    def __len__(self) -> int:
+        return len(self._readers)
+
+    def __enter__(self) -> "ReaderPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,166 @@
+"""
+Comparison tables declared as data, rebuilt only when their inputs change.
+
+A `Comparison` names the CBI table and column it is compared with, the hbsir
+table its household indicator is computed from, and the indicator
+expression. `run` builds the dependency graph of the comparisons (each source
+table feeds the comparisons computed from it), fingerprints the inputs of
+every comparison (its definition, the source table request, the household
+properties and the cleaned CBI table) and recomputes only the comparisons
+whose fingerprint differs from the one recorded in the manifest, or whose
+output file changed. Stale comparisons of the same source share one load and
+one `create_sci_values` aggregation.
+"""
+
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+
+from . import sci, storage, tracing
+from .hbsir_cache import Step, TableCache
+from .manifest import Manifest, hash_frame, hash_value
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """
+    The weighted mean of `indicator`, evaluated on the `source` hbsir table
+    and multiplied by `scale`, next to the `cbi_column` (by default `column`)
+    of the cleaned CBI `table`. Written to `<table>/<column>` in the output
+    directory.
+    """
+    table: str
+    column: str
+    source: str
+    indicator: str | pl.Expr
+    cbi_column: str | None = None
+    years: str = "71-03"
+    steps: tuple[Step, ...] = ()
+    scale: int | float = 1
+
+    @property
+    def key(self) -> str:
+        return f"{self.table}/{self.column}"
+
+    def get_source_key(self) -> tuple:
+        return (self.source, self.years, self.steps)
+
+    def get_expression(self) -> pl.Expr:
+        expression = sci.as_indicator(self.indicator)
+        if self.scale != 1:
+            expression = expression.mul(self.scale)
+        return expression.alias(self.key)
+
+    def get_fingerprint(self) -> str:
+        return hash_value({
+            "table": self.table,
+            "column": self.column,
+            "source": self.source,
+            "indicator": sci.as_indicator(self.indicator).meta.serialize(format="json"),
+            "cbi_column": self.cbi_column or self.column,
+            "years": self.years,
+            "steps": [[s.function, list(s.args), [list(kv) for kv in s.kwargs]] for s in self.steps],
+            "scale": self.scale,
+        })
+
+
+def get_graph(comparisons: Iterable[Comparison]) -> dict[tuple, list[Comparison]]:
+    """
+    The comparisons computed from each source table request, in order.
+    """
+    graph: dict[tuple, list[Comparison]] = {}
+    for comparison in comparisons:
+        graph.setdefault(comparison.get_source_key(), []).append(comparison)
+    return graph
+
+
+def read_cbi_table(cleaned_dir: str | Path, table: str) -> pl.DataFrame:
+    """
+    The latest report of every year of a cleaned CBI table.
+    """
+    return (
+        storage.read_table(Path(cleaned_dir) / table)
+        .sort("Report_Year", "Year")
+        .unique("Year", keep="last")
+        .sort("Year")
+    )
+
+
+def run(
+    comparisons: Sequence[Comparison],
+    household_properties: pl.DataFrame,
+    table_cache: TableCache,
+    cleaned_dir: str | Path,
+    output_dir: str | Path,
+    manifest: Manifest,
+    replicates: int | None = None,
+    replicate_weights: Sequence[str] | None = None,
+    variance_factor: float | None = None,
+) -> list[Comparison]:
+    """
+    Write every comparison table whose inputs changed since the last run,
+    record them in `manifest` and return them.
+
+    With `replicates` or `replicate_weights`, the SCI values come with
+    standard errors and confidence intervals, see `sci.create_sci_values`.
+    """
+    keys = [c.key for c in comparisons]
+    duplicates = {k for k in keys if keys.count(k) > 1}
+    if duplicates:
+        raise ValueError(f"Comparisons defined more than once: {sorted(duplicates)}")
+
+    properties_hash = hash_frame(household_properties)
+    cbi_hashes = {}
+    inputs = {}
+    for comparison in comparisons:
+        if comparison.table not in cbi_hashes:
+            paths = storage.get_table_paths(Path(cleaned_dir) / comparison.table).values()
+            cbi_hashes[comparison.table] = manifest.hash_files(p for p in paths if p.exists())
+        inputs[comparison.key] = {
+            "definition": comparison.get_fingerprint(),
+            "source": table_cache.get_path(comparison.source, comparison.years, comparison.steps).name,
+            "household_properties": properties_hash,
+            "cbi": cbi_hashes[comparison.table],
+            "replicates": replicates,
+            "replicate_weights": None if replicate_weights is None else list(replicate_weights),
+            "variance_factor": variance_factor,
+        }
+
+    stale = [c for c in comparisons if not manifest.is_fresh(f"comparison/{c.key}", inputs[c.key])]
+    cbi_tables = {}
+    with tracing.span("registry.run", comparisons=len(comparisons), stale=len(stale)):
+        for (source, years, steps), group in get_graph(stale).items():
+            expressions = [c.get_expression() for c in group]
+            table = table_cache.load_table(
+                source, years, *steps,
+                columns=["Year", "ID", *sci.get_root_columns(expressions)],
+            )
+            sci_values = sci.create_sci_values(
+                table.select("Year", "ID", *expressions),
+                household_properties,
+                [c.key for c in group],
+                replicates=replicates,
+                replicate_weights=replicate_weights,
+                variance_factor=variance_factor,
+            )
+            for comparison in group:
+                if comparison.table not in cbi_tables:
+                    cbi_tables[comparison.table] = read_cbi_table(cleaned_dir, comparison.table)
+                cbi_data = cbi_tables[comparison.table].select(
+                    "Year", pl.col(comparison.cbi_column or comparison.column).alias("CBI"),
+                )
+                paths = storage.write_table(
+                    pl.concat(
+                        [
+                            cbi_data,
+                            sci_values.filter(pl.col("Indicator") == comparison.key).drop("Indicator"),
+                        ],
+                        how="align",
+                    ),
+                    Path(output_dir) / comparison.key,
+                )
+                manifest.record(f"comparison/{comparison.key}", inputs[comparison.key], paths)
+    manifest.save()
+    return stale
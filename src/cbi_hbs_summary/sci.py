@@ -0,0 +1,362 @@
+from collections.abc import Iterable, Sequence
+from typing import Literal
+
+import polars as pl
+
+from . import tracing
+from .segments import (
+    ALL, CBI_SAMPLE, URBAN, Segment, replicate_means, weighted_means, weighted_quantiles, weighted_shares,
+)
+
+
+SEGMENTS = [ALL, URBAN, CBI_SAMPLE]
+
+
+def create_sci_values(
+    table: pl.DataFrame,
+    household_properties: pl.DataFrame,
+    value_columns: Sequence[str] | None = None,
+    how: Literal["long", "wide"] = "long",
+    segments: Sequence[Segment] | None = None,
+    replicates: int | None = None,
+    seed: int = 0,
+    replicate_weights: Sequence[str] | None = None,
+    variance_factor: float | None = None,
+    confidence: float = 0.95,
+) -> pl.DataFrame:
+    """
+    Weighted averages of value columns of `table` over all households, urban
+    households and the urban households of the CBI sample, or over the given
+    `segments`.
+
+    `household_properties` holds the Year, ID, Weight, Urban_Rural and
+    CBI_Sample of every household, and whatever else the segments use. Each
+    segment gives an SCI_<segment> column, or an SCI_<segment>_<group> column
+    per group of a partition segment. Without `value_columns`, the last column
+    of `table` is averaged and the result has the Year and segment columns.
+    With `value_columns`, all of them are averaged from a single join and
+    aggregation. The long result has an Indicator column next to Year, and the
+    wide result has SCI_<segment>_<indicator> columns.
+
+    With `replicates`, the segment columns are followed by their bootstrap
+    standard errors, then by the lower and upper bounds of their
+    `confidence` intervals: all SCI_<segment>_SE columns, then all
+    SCI_<segment>_Lower and all SCI_<segment>_Upper columns, see
+    `segments.replicate_means`. The households of each year are resampled
+    `replicates` times, from a generator seeded with `seed`. With
+    `replicate_weights`, columns of `household_properties`, each of them is
+    a replicate weight in place of the bootstrap, and the sum of squared
+    deviations of the replicates is multiplied by `variance_factor`.
+    """
+    columns = [table.columns[-1]] if value_columns is None else list(value_columns)
+    households = household_properties.lazy().join(
+        table.lazy().select("Year", "ID", *columns),
+        on=["Year", "ID"],
+        how="left",
+    )
+    with tracing.span("create_sci_values", rows=household_properties.height, columns=len(columns)):
+        sci_values = _aggregate_sci_values(
+            households, columns, segments or SEGMENTS, replicates, seed,
+            replicate_weights, variance_factor, confidence,
+        )
+    if value_columns is None:
+        return sci_values.drop("Indicator")
+    return _reshape_sci_values(sci_values, how)
+
+
+def aggregate_sci_values(
+    households: pl.DataFrame | pl.LazyFrame,
+    value_columns: Sequence[str],
+    how: Literal["long", "wide"] = "long",
+    segments: Sequence[Segment] | None = None,
+    replicates: int | None = None,
+    seed: int = 0,
+    replicate_weights: Sequence[str] | None = None,
+    variance_factor: float | None = None,
+    confidence: float = 0.95,
+) -> pl.DataFrame:
+    """
+    `create_sci_values` of households that already hold their Weight,
+    segment and value columns, such as a scan of the household cube. Only the
+    needed columns are read from a lazy frame.
+    """
+    with tracing.span("aggregate_sci_values", columns=len(value_columns)):
+        sci_values = _aggregate_sci_values(
+            households.lazy(), list(value_columns), segments or SEGMENTS, replicates, seed,
+            replicate_weights, variance_factor, confidence,
+        )
+    return _reshape_sci_values(sci_values, how)
+
+
+def _reshape_sci_values(sci_values: pl.DataFrame, how: Literal["long", "wide"]) -> pl.DataFrame:
+    if how == "wide":
+        values = sci_values.columns[2:]
+        wide = sci_values.pivot(on="Indicator", index="Year", values=values, separator="_")
+        if len(values) == 1:
+            # A single values column is not prefixed by the pivot
+            wide = wide.rename({c: f"{values[0]}_{c}" for c in wide.columns[1:]})
+        return wide
+    return sci_values
+
+
+def _get_segment_weights() -> list[pl.Expr]:
+    # Weights of the households outside a segment are null, so they are
+    # skipped by the sums like the filtered values would be
+    return [
+        pl.when(segment.condition).then(pl.col("Weight")).alias(f"Weight_SCI_{segment.name}")
+        for segment in SEGMENTS
+    ]
+
+
+def _pivot_segments(
+    values: pl.DataFrame,
+    columns: list[str],
+    index: list[str],
+    segments: Sequence[Segment],
+) -> pl.DataFrame:
+    """
+    One SCI_<segment> or SCI_<segment>_<group> column per segment and group
+    of a long `segments` result, sorted by Indicator (in the order of
+    `columns`), `index` and Year. Rows of a Statistic other than Value get
+    its name as a suffix. Condition segments without any member keep their
+    columns, filled with nulls.
+    """
+    order = [pl.col("Segment").cast(pl.Enum([s.name for s in segments]))]
+    if "Statistic" in values.columns:
+        statistics = values.get_column("Statistic").unique(maintain_order=True).to_list()
+        order.insert(0, pl.col("Statistic").cast(pl.Enum(statistics)))
+        suffix = pl.when(pl.col("Statistic") != "Value").then(pl.lit("_") + pl.col("Statistic"))
+    else:
+        statistics = [None]
+        suffix = pl.lit(None, pl.String)
+
+    present = set(values.get_column("Segment"))
+    empty = [s.name for s in segments if s.by is None and s.name not in present]
+    if empty and values.height > 0:
+        # A null row of each empty segment, the pivot fills in the others
+        first = values.head(1).with_columns(
+            pl.lit(None, pl.String).alias("Group"),
+            pl.lit(None, values.schema["Value"]).alias("Value"),
+        )
+        values = pl.concat([
+            values,
+            *(
+                first.with_columns(
+                    pl.lit(name).alias("Segment"),
+                    *([] if statistic is None else [pl.lit(statistic).alias("Statistic")]),
+                )
+                for name in empty
+                for statistic in statistics
+            ),
+        ])
+    return (
+        values
+        # Statistics, then segments in the given order
+        .sort(order, maintain_order=True)
+        .with_columns(
+            pl.concat_str(
+                pl.lit("SCI_"), "Segment", pl.lit("_") + pl.col("Group"), suffix, ignore_nulls=True,
+            ).alias("Segment"),
+            pl.col("Indicator").cast(pl.Enum(columns)),
+        )
+        # Segments, and groups within them, come in order, so they are the
+        # column order of the pivot
+        .pivot(on="Segment", index=["Year", "Indicator", *index], values="Value")
+        .sort("Indicator", *index, "Year")
+        .with_columns(pl.col("Indicator").cast(pl.String))
+    )
+
+
+def _aggregate_sci_values(
+    households: pl.LazyFrame,
+    columns: list[str],
+    segments: Sequence[Segment],
+    replicates: int | None = None,
+    seed: int = 0,
+    replicate_weights: Sequence[str] | None = None,
+    variance_factor: float | None = None,
+    confidence: float = 0.95,
+) -> pl.DataFrame:
+    if replicates is None and replicate_weights is None:
+        values = weighted_means(households, columns, segments)
+        estimate = pl.lit(True)
+    else:
+        values = replicate_means(
+            households,
+            columns,
+            segments,
+            replicates=replicates or 0,
+            seed=seed,
+            replicate_weights=replicate_weights,
+            variance_factor=variance_factor,
+            confidence=confidence,
+        ).unpivot(
+            on=["Value", "SE", "Lower", "Upper"],
+            index=["Year", "Segment", "Group", "Indicator"],
+            variable_name="Statistic",
+            value_name="Value",
+        )
+        estimate = pl.col("Statistic") == "Value"
+    # A zero estimate is taken as missing, while a zero standard error is an
+    # exact estimate
+    values = values.with_columns(
+        pl.when(estimate & (pl.col("Value") == 0)).then(None).otherwise(pl.col("Value")).fill_nan(None)
+        .alias("Value")
+    )
+    return _pivot_segments(values, columns, [], segments)
+
+
+def _join_households(
+    table: pl.DataFrame,
+    household_properties: pl.DataFrame,
+    columns: list[str],
+) -> pl.LazyFrame:
+    # Unlike the SCI means, where a missing household counts as zero, only
+    # the households of the table are ranked, so households without a record
+    # (and years missing from the table) do not add zeros to the quantiles
+    return household_properties.lazy().join(
+        table.lazy().select("Year", "ID", *columns), on=["Year", "ID"], how="inner",
+    )
+
+
+def create_quantiles(
+    table: pl.DataFrame,
+    household_properties: pl.DataFrame,
+    value_columns: Sequence[str],
+    quantiles: Sequence[float] = (0.1, 0.25, 0.5, 0.75, 0.9),
+    segments: Sequence[Segment] | None = None,
+) -> pl.DataFrame:
+    """
+    Weighted quantiles of value columns of `table` for every year and
+    segment, such as the median expenditure of urban households.
+
+    Only the households of `household_properties` found in `table` are
+    ranked, and null values are left out. Each value column is sorted once
+    for all the quantiles, segments and years, see
+    `segments.weighted_quantiles`. The result has the Year, Indicator,
+    Quantile and SCI_<segment> columns.
+    """
+    columns = list(value_columns)
+    households = _join_households(table, household_properties, columns)
+    with tracing.span("create_quantiles", rows=household_properties.height, columns=len(columns)):
+        values = weighted_quantiles(households, columns, quantiles, segments or SEGMENTS)
+    return _pivot_segments(values, columns, ["Quantile"], segments or SEGMENTS)
+
+
+def create_shares(
+    table: pl.DataFrame,
+    household_properties: pl.DataFrame,
+    value_columns: Sequence[str],
+    n: int = 10,
+    segments: Sequence[Segment] | None = None,
+    scale: int | float = 100,
+) -> pl.DataFrame:
+    """
+    Share of each value column of `table` held by each weighted n-tile of
+    the households ranked by it (decile shares by default), for every year
+    and segment, multiplied by `scale`.
+
+    Only the households of `household_properties` found in `table` are
+    ranked, and null values are left out. The result has the Year,
+    Indicator, N_Tile and SCI_<segment> columns.
+    """
+    columns = list(value_columns)
+    households = _join_households(table, household_properties, columns)
+    with tracing.span("create_shares", rows=household_properties.height, columns=len(columns)):
+        values = weighted_shares(households, columns, segments or SEGMENTS, n)
+    return _pivot_segments(
+        values.with_columns(pl.col("Value").mul(scale)), columns, ["N_Tile"], segments or SEGMENTS,
+    )
+
+
+def create_distribution(
+    table: pl.DataFrame,
+    household_properties: pl.DataFrame,
+    column: str,
+    categories: Sequence,
+    top: int | None = None,
+    scale: int | float = 100,
+) -> pl.DataFrame:
+    """
+    Weighted share of each category of `column` for every year and segment,
+    from one join and one `group_by`.
+
+    Values of at least `top` fall in an open ended top bin labeled
+    "<top>_plus". The result has the Year, Category, SCI_All, SCI_Urban and
+    SCI_CBI_Sample columns, with a row for every year and category. Shares
+    are computed like `create_sci_values` of `column == category`: rows with
+    a null or unlisted category still count in the denominator.
+    """
+    labels = [f"{c}_plus" if c == top else str(c) for c in categories]
+    category = pl.col(column).cast(pl.String)
+    if top is not None:
+        category = pl.when(pl.col(column) >= top).then(pl.lit(f"{top}_plus")).otherwise(category)
+    names = [f"SCI_{segment.name}" for segment in SEGMENTS]
+    weights = [f"Weight_{name}" for name in names]
+
+    with tracing.span("create_distribution", rows=household_properties.height, column=column):
+        households = (
+            household_properties.lazy()
+            .join(table.lazy().select("Year", "ID", column), on=["Year", "ID"], how="left")
+            .select("Year", category.alias("Category"), *_get_segment_weights())
+        )
+        totals = households.group_by("Year").agg(pl.col(weights).sum())
+        category_totals = (
+            households
+            .filter(pl.col("Category").is_in(labels))
+            .group_by("Year", "Category")
+            .agg(pl.col(weights).sum())
+        )
+        distribution = (
+            totals.select("Year")
+            .join(pl.LazyFrame({"Category": labels}), how="cross")
+            .join(category_totals, on=["Year", "Category"], how="left")
+            .join(totals, on="Year", suffix="_Total")
+            .select(
+                "Year",
+                pl.col("Category").cast(pl.Enum(labels)),
+                *(
+                    pl.col(f"Weight_{name}").fill_null(0)
+                    .truediv(pl.col(f"Weight_{name}_Total"))
+                    .mul(scale)
+                    .alias(name)
+                    for name in names
+                ),
+            )
+            .sort("Category", "Year")
+            .with_columns(
+                pl.col("Category").cast(pl.String),
+                pl.col(names).replace(0, None).fill_nan(None),
+            )
+            .collect()
+        )
+    return distribution
+
+
+def as_indicator(indicator: str | pl.Expr) -> pl.Expr:
+    if isinstance(indicator, str):
+        return pl.col(indicator)
+    return indicator
+
+
+def get_root_columns(indicators: Iterable[str | pl.Expr]) -> list[str]:
+    """
+    Columns the indicators are computed from, in order of first use.
+    """
+    columns = (c for i in indicators for c in as_indicator(i).meta.root_names())
+    return list(dict.fromkeys(columns))
+
+
+def evaluate_indicators(
+    table: pl.DataFrame,
+    indicators: Iterable[str | pl.Expr],
+    scale: int | float = 1,
+) -> pl.DataFrame:
+    """
+    Year, ID and every indicator evaluated on `table` in a single `select`,
+    multiplied by `scale`. Each indicator is named by its output name.
+    """
+    return table.select(
+        "Year", "ID",
+        *(as_indicator(i) if scale == 1 else as_indicator(i).mul(scale) for i in indicators),
+    )
@@ -0,0 +1,101 @@
+"""
+Search index over the table names of the CBI index.
+
+Names are folded before they are split into tokens, and the app folds queries
+the same way. ZWNJ is removed, so "گروه‌های" and "گروههای" are the same
+token. The text is sanitized with `utils.sanitize_farsi_text`, which maps
+Arabic letters to Farsi and removes invisible characters and punctuation.
+`SEARCH_CHARACTERS` unifies the remaining letter variants, diacritics and
+digits. Every pair of adjacent tokens is also indexed written together, so a
+name written with a space ("گروه های") matches a query written with ZWNJ.
+
+The app cannot import this package in the browser, so `build_query_folding`
+publishes the character replacements next to the index. The app folds a
+query with `str.translate`, drops a trailing ".0" like the sanitization,
+lowercases it and splits it on whitespace.
+"""
+
+import polars as pl
+
+from . import utils
+
+
+SEARCH_CHARACTERS = {
+    "آ": "ا",
+    "ٱ": "ا",
+    "ھ": "ه",
+    "ء": "",
+    # Harakat, shadda, sukun and superscript alef
+    **{chr(c): "" for c in range(0x064B, 0x0653)},
+    chr(0x0670): "",
+    # Persian and Arabic digits
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    # Separators left by the sanitization
+    **{c: " " for c in "،()-/"},
+}
+
+
+# Every single character replacement of `normalize_search_text`, in one pass:
+# ZWNJ removed, then the sanitization, then the search characters
+QUERY_CHARACTERS = {
+    **{
+        character: replacement.translate(str.maketrans(SEARCH_CHARACTERS))
+        for character, replacement in utils.CHARACTER_MAPPING.items()
+    },
+    **{
+        character: replacement
+        for character, replacement in SEARCH_CHARACTERS.items()
+        if character not in utils.CHARACTER_MAPPING
+    },
+    chr(8204): "",
+}
+
+
+def normalize_search_text(column: pl.Expr) -> pl.Expr:
+    """
+    Fold Farsi text for search, see the module docstring.
+    """
+    return (
+        column
+        .str.replace_all(chr(8204), "", literal=True)
+        .pipe(utils.sanitize_farsi_text)
+        .str.replace_many(SEARCH_CHARACTERS)
+        .str.to_lowercase()
+        .str.replace_all(" {2,}", " ")
+        .str.strip_chars(" ")
+    )
+
+
+def build_search_index(index: pl.DataFrame) -> pl.DataFrame:
+    """
+    The distinct table names of `index` with their Tokens, separated by
+    spaces: the tokens of the folded name followed by each pair of adjacent
+    tokens joined together.
+    """
+    tokens = pl.col("Table_Name").pipe(normalize_search_text).str.split(" ")
+    return (
+        index
+        .select(pl.col("Table_Name").unique().sort())
+        .with_columns(tokens.alias("Tokens"))
+        .with_columns(
+            pl.concat_list(
+                "Tokens",
+                pl.col("Tokens").list.eval((pl.element() + pl.element().shift(-1)).drop_nulls()),
+            )
+            .list.unique(maintain_order=True)
+            .list.join(" ")
+        )
+    )
+
+
+def build_query_folding() -> pl.DataFrame:
+    """
+    `QUERY_CHARACTERS` as a table of Character and Replacement columns, for
+    the app to build its `str.maketrans` table from.
+    """
+    return pl.DataFrame(
+        list(QUERY_CHARACTERS.items()),
+        schema={"Character": pl.String, "Replacement": pl.String},
+        orient="row",
+    )
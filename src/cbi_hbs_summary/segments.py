@@ -0,0 +1,446 @@
+"""
+Survey segments declared as data, and weighted means, quantiles and n-tile
+shares over all of them.
+
+A segment is either a boolean condition (urban households, the CBI sample,
+any expression) or a partition of the households by the values of an
+expression (province, county, income decile), optionally restricted by a
+condition. Each household gets a bit mask of the conditions it satisfies, and
+a single `group_by` over the year, the mask and the partition values sums the
+weights and weighted values. Every segment is then rolled up from these few
+cells, so adding a segment with 31 groups does not add 31 passes over the
+households. Quantiles and shares sort each value column once, and every
+segment and group is a filter of the sorted rows.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+import statistics
+
+import polars as pl
+
+
+@dataclass(frozen=True)
+class Segment:
+    """
+    Households satisfying `condition`, split into one group per value of `by`
+    when it is given. Households where `condition` is null are not members,
+    and households where `by` is null are in no group.
+    """
+    name: str
+    condition: pl.Expr | None = None
+    by: pl.Expr | None = None
+
+    def __post_init__(self) -> None:
+        if self.condition is None and self.by is None:
+            raise ValueError(f"Segment {self.name} needs a condition or a by expression")
+
+
+def condition(name: str, expr: pl.Expr) -> Segment:
+    return Segment(name, condition=expr)
+
+
+def partition(name: str, by: str | pl.Expr, where: pl.Expr | None = None) -> Segment:
+    if isinstance(by, str):
+        by = pl.col(by)
+    return Segment(name, condition=where, by=by)
+
+
+ALL = condition("All", pl.lit(True))
+URBAN = condition("Urban", pl.col("Urban_Rural") == "Urban")
+RURAL = condition("Rural", pl.col("Urban_Rural") == "Rural")
+CBI_SAMPLE = condition("CBI_Sample", (pl.col("Urban_Rural") == "Urban") & pl.col("CBI_Sample"))
+PROVINCE = partition("Province", "Province")
+COUNTY = partition("County", "County")
+
+
+class _Encoding:
+    """
+    The membership of every household in the segments: a bit mask of the
+    conditions it satisfies and its value of every partition.
+    """
+
+    def __init__(self, segments: Sequence[Segment], by: list[str]) -> None:
+        names = [s.name for s in segments]
+        if len(set(names)) < len(names):
+            raise ValueError(f"Segment names are not unique: {names}")
+        conditions = [s for s in segments if s.condition is not None]
+        if len(conditions) > 63:
+            raise ValueError("At most 63 segments can have a condition")
+        self.segments = segments
+        self.by = by
+        self.bits = {s.name: i for i, s in enumerate(conditions)}
+        partitions = [s for s in segments if s.by is not None]
+        self.group_columns = {s.name: f"_Group_{i}" for i, s in enumerate(partitions)}
+
+        if conditions:
+            mask = pl.sum_horizontal(
+                pl.when(s.condition).then(pl.lit(1 << self.bits[s.name], pl.Int64)).otherwise(0)
+                for s in conditions
+            )
+        else:
+            mask = pl.lit(0, pl.Int64)
+        self.columns = [
+            mask.alias("_Mask"),
+            *(s.by.alias(self.group_columns[s.name]) for s in partitions),
+        ]
+        self.keys = [*by, "_Mask", *self.group_columns.values()]
+
+    def get_members(self, frame: pl.DataFrame, segment: Segment) -> tuple[pl.DataFrame, list[str]]:
+        """
+        Rows of `frame` in the segment, in their order, and the columns that
+        identify the groups of the segment.
+        """
+        if segment.condition is not None:
+            frame = frame.filter((pl.col("_Mask") & (1 << self.bits[segment.name])) != 0)
+        if segment.by is None:
+            return frame, self.by
+        group_column = self.group_columns[segment.name]
+        return frame.filter(pl.col(group_column).is_not_null()), [*self.by, group_column]
+
+    def get_labels(self, segment: Segment) -> list[pl.Expr]:
+        if segment.by is None:
+            group = pl.lit(None, pl.String)
+        else:
+            group = pl.col(self.group_columns[segment.name]).cast(pl.String)
+        return [*self.by, pl.lit(segment.name).alias("Segment"), group.alias("Group")]
+
+
+def weighted_means(
+    households: pl.DataFrame | pl.LazyFrame,
+    value_columns: Sequence[str],
+    segments: Sequence[Segment],
+    weight: str = "Weight",
+    by: Sequence[str] = ("Year",),
+) -> pl.DataFrame:
+    """
+    Weighted mean of every value column in every segment, for each group of
+    `by`.
+
+    The result is long, with the `by` columns, Segment, Group (the partition
+    value as a string, null for condition only segments), Indicator and
+    Value. Null values count as zero in the numerator, while their weight
+    stays in the denominator. Segments keep the given order, groups are
+    sorted.
+    """
+    encoding = _Encoding(segments, list(by))
+    sums = [f"_Sum_{i}" for i in range(len(value_columns))]
+    cells = (
+        households.lazy()
+        .select(
+            *by,
+            *encoding.columns,
+            pl.col(weight).alias("_Weight"),
+            *(pl.col(c).mul(pl.col(weight)).alias(s) for c, s in zip(value_columns, sums)),
+        )
+        .group_by(encoding.keys)
+        .agg(pl.col("_Weight", *sums).sum())
+        .collect()
+    )
+
+    frames = []
+    for segment in segments:
+        members, keys = encoding.get_members(cells, segment)
+        frame = members.group_by(keys).agg(pl.col("_Weight", *sums).sum())
+        # Groups sorted by their values, not their string labels
+        frames.append(
+            frame.sort(*keys[len(by):], *by).select(
+                *encoding.get_labels(segment),
+                *(pl.col(s).truediv(pl.col("_Weight")).alias(c) for c, s in zip(value_columns, sums)),
+            )
+        )
+    return (
+        pl.concat(frames)
+        .unpivot(index=[*by, "Segment", "Group"], variable_name="Indicator", value_name="Value")
+    )
+
+
+def _sort_values(
+    households: pl.DataFrame | pl.LazyFrame,
+    encoding: _Encoding,
+    column: str,
+    weight: str,
+) -> pl.DataFrame:
+    # The one sort of a value column. Filtering keeps the order, so every
+    # segment and group of it is sorted too.
+    return (
+        households.lazy()
+        .select(*encoding.by, *encoding.columns, pl.col(weight).alias("_Weight"), pl.col(column).alias("_Value"))
+        .drop_nulls("_Value")
+        .sort(*encoding.by, "_Value")
+        .collect()
+    )
+
+
+def weighted_quantiles(
+    households: pl.DataFrame | pl.LazyFrame,
+    value_columns: Sequence[str],
+    quantiles: Sequence[float],
+    segments: Sequence[Segment],
+    weight: str = "Weight",
+    by: Sequence[str] = ("Year",),
+) -> pl.DataFrame:
+    """
+    Weighted quantiles of every value column in every segment, for each
+    group of `by`.
+
+    The `q` quantile is the smallest value whose cumulative weight reaches
+    `q` times the total weight of the group, as the inverted CDF definition
+    of `numpy.quantile` with weights. Each value column is sorted once, and
+    every quantile of a group is found by a binary search of its cumulative
+    weights. Households with a null value are left out. The result is long,
+    like `weighted_means`, with a Quantile column after Indicator.
+    """
+    encoding = _Encoding(segments, list(by))
+    targets = pl.lit(pl.Series(list(quantiles), dtype=pl.Float64))
+    frames = []
+    for column in value_columns:
+        values = _sort_values(households, encoding, column, weight)
+        for segment in segments:
+            members, keys = encoding.get_members(values, segment)
+            last = pl.len().cast(pl.Int64) - 1
+            frame = (
+                members
+                .select(
+                    *keys,
+                    "_Value",
+                    pl.col("_Weight").cum_sum().over(keys).alias("_Cumulative"),
+                    pl.col("_Weight").sum().over(keys).alias("_Total"),
+                )
+                .group_by(keys, maintain_order=True)
+                .agg(
+                    pl.col("_Value").gather(
+                        pl.col("_Cumulative").search_sorted(pl.col("_Total").first() * targets, side="left")
+                        .cast(pl.Int64).clip(upper_bound=last)
+                    ).alias("Value")
+                )
+                .sort(*keys[len(by):], *by)
+            )
+            frames.append(
+                frame.select(
+                    *encoding.get_labels(segment),
+                    pl.lit(column).alias("Indicator"),
+                    "Value",
+                    pl.lit(list(quantiles), pl.List(pl.Float64)).alias("Quantile"),
+                )
+                .explode("Quantile", "Value")
+                .select(*by, "Segment", "Group", "Indicator", "Quantile", "Value")
+            )
+    return pl.concat(frames)
+
+
+def ntile(
+    value: str | pl.Expr,
+    n: int = 10,
+    weight: str = "Weight",
+    over: str | Sequence[str] = "Year",
+) -> pl.Expr:
+    """
+    Weighted n-tile (1 to `n`) of every household within each group of
+    `over`, such as the expenditure decile of the household in its year.
+
+    Households are ranked by `value` and placed by the midpoint of their
+    cumulative weight share, so each n-tile holds close to 1 / n of the
+    weight. Households with a null value get a null n-tile. Usable as the
+    `by` of a partition segment.
+    """
+    if isinstance(value, str):
+        value = pl.col(value)
+    w = pl.when(value.is_not_null()).then(pl.col(weight))
+    order = value.arg_sort(nulls_last=True)
+    # Midpoint cumulative share in sorted order, put back in row order
+    share = (w.gather(order).cum_sum() - w.gather(order) / 2).gather(order.arg_sort()) / w.sum()
+    return (
+        pl.when(value.is_not_null())
+        .then((share * n).floor().clip(0, n - 1).cast(pl.Int8) + 1)
+        .over(over)
+    )
+
+
+def weighted_shares(
+    households: pl.DataFrame | pl.LazyFrame,
+    value_columns: Sequence[str],
+    segments: Sequence[Segment],
+    n: int = 10,
+    weight: str = "Weight",
+    by: Sequence[str] = ("Year",),
+) -> pl.DataFrame:
+    """
+    Share of the weighted total of every value column held by each weighted
+    n-tile of the value (decile shares with the default `n`), in every
+    segment, for each group of `by`.
+
+    The n-tiles are found within each segment and group, as `ntile` does,
+    from one sort per value column. Households with a null value are left
+    out. The result is long, like `weighted_means`, with an N_Tile column
+    after Indicator.
+    """
+    encoding = _Encoding(segments, list(by))
+    frames = []
+    for column in value_columns:
+        values = _sort_values(households, encoding, column, weight)
+        for segment in segments:
+            members, keys = encoding.get_members(values, segment)
+            cumulative = pl.col("_Weight").cum_sum().over(keys) - pl.col("_Weight") / 2
+            share = cumulative / pl.col("_Weight").sum().over(keys)
+            frame = (
+                members
+                .with_columns(
+                    (share * n).floor().clip(0, n - 1).cast(pl.Int8).add(1).alias("N_Tile"),
+                    pl.col("_Value").mul(pl.col("_Weight")).alias("_Total"),
+                )
+                .group_by(*keys, "N_Tile")
+                .agg(pl.col("_Total").sum())
+                .with_columns(pl.col("_Total").truediv(pl.col("_Total").sum().over(keys)).alias("Value"))
+                .sort(*keys[len(by):], *by, "N_Tile")
+            )
+            frames.append(
+                frame.select(
+                    *encoding.get_labels(segment),
+                    pl.lit(column).alias("Indicator"),
+                    "N_Tile",
+                    "Value",
+                )
+            )
+    return pl.concat(frames)
+
+
+def replicate_means(
+    households: pl.DataFrame | pl.LazyFrame,
+    value_columns: Sequence[str],
+    segments: Sequence[Segment],
+    replicates: int = 200,
+    seed: int = 0,
+    replicate_weights: Sequence[str] | None = None,
+    variance_factor: float | None = None,
+    confidence: float = 0.95,
+    weight: str = "Weight",
+    by: Sequence[str] = ("Year",),
+) -> pl.DataFrame:
+    """
+    `weighted_means` with standard errors and normal confidence intervals
+    from bootstrap replicates or from replicate weight columns.
+
+    By default, the households of each group of `by` are resampled with
+    replacement `replicates` times, from a generator seeded with `seed`.
+    With `replicate_weights`, each of those columns is a replicate weight
+    used in place of `weight`. The standard error is
+    `sqrt(variance_factor * sum((replicate - estimate) ** 2))`, where
+    `variance_factor` defaults to 1 / (replicates - 1). Set it to match the
+    replicate weight scheme, e.g. 1 / R for BRR or (R - 1) / R for JK1.
+
+    Every replicate is computed at once. The households of a group are
+    sorted by their segment cell, as in `weighted_means`. Each cell gives
+    one product of its replicate multiplier matrix (households by
+    replicates) with its weight and weighted value columns. Segments are
+    rolled up from these cell totals. The result is long, like
+    `weighted_means`, with SE, Lower and Upper columns after Value.
+    """
+    import numpy as np
+
+    by = list(by)
+    columns = list(value_columns)
+    encoding = _Encoding(segments, by)
+    multipliers = list(replicate_weights or [])
+    if multipliers:
+        replicates = len(multipliers)
+    elif replicates < 2:
+        raise ValueError(f"The bootstrap needs at least 2 replicates, got {replicates}")
+    if variance_factor is None:
+        if replicates < 2:
+            raise ValueError("A single replicate weight needs a variance_factor")
+        variance_factor = 1 / (replicates - 1)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+    frame = (
+        households.lazy()
+        .select(
+            *by,
+            *encoding.columns,
+            pl.col(weight).alias("_Weight"),
+            *(pl.col(c).fill_null(0).alias(f"_Value_{i}") for i, c in enumerate(columns)),
+            *multipliers,
+        )
+        .sort(encoding.keys, nulls_last=True)
+        .collect()
+    )
+    if multipliers:
+        # A null replicate weight would turn every standard error of its
+        # year into NaN
+        groups = [pl.col(c).is_not_null() for c in encoding.group_columns.values()]
+        members = frame.filter(pl.any_horizontal(pl.col("_Mask") != 0, *groups))
+        null_counts = members.select(pl.col(multipliers).null_count()).row(0, named=True)
+        missing = {c: n for c, n in null_counts.items() if n > 0}
+        if missing:
+            raise ValueError(f"Replicate weights are null for member households: {missing}")
+
+    cells = frame.group_by(encoding.keys, maintain_order=True).len("_Rows").with_row_index("_Cell")
+    ends = cells.get_column("_Rows").cum_sum().to_numpy()
+    starts = ends - cells.get_column("_Rows").to_numpy()
+    years = cells.group_by(by, maintain_order=True).agg(
+        pl.col("_Cell").min().alias("_First"), pl.col("_Cell").max().alias("_Last"),
+    )
+
+    weights = frame.get_column("_Weight").to_numpy().astype(np.float64)
+    values = frame.select(f"_Value_{i}" for i in range(len(columns))).to_numpy().astype(np.float64)
+    # Weight and weighted values of each household. A replicate multiplier
+    # matrix scales them, while replicate weights replace the weight.
+    weighted = np.column_stack([weights, values * weights[:, None]])
+    if multipliers:
+        base = np.column_stack([np.ones_like(weights), values])
+        replicate_matrix = frame.select(multipliers).to_numpy().astype(np.float64)
+    else:
+        base = weighted
+
+    rng = np.random.default_rng(seed)
+    totals = np.empty((cells.height, base.shape[1]))
+    replicate_totals = np.empty((cells.height, replicates, base.shape[1]))
+    for first, last in years.select("_First", "_Last").iter_rows():
+        offset = starts[first]
+        n = ends[last] - offset
+        if multipliers:
+            matrix = replicate_matrix[offset:ends[last]]
+        else:
+            # How many times each household of the group is drawn in each
+            # replicate, counted for all replicates by one bincount
+            draws = rng.integers(0, n, size=(replicates, n)) + np.arange(replicates)[:, None] * n
+            matrix = np.bincount(draws.ravel(), minlength=replicates * n).reshape(replicates, n).T
+            matrix = matrix.astype(np.float64)
+        for cell in range(first, last + 1):
+            rows = slice(starts[cell], ends[cell])
+            totals[cell] = weighted[rows].sum(axis=0)
+            replicate_totals[cell] = matrix[starts[cell] - offset:ends[cell] - offset].T @ base[rows]
+
+    records = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for segment in segments:
+            members, keys = encoding.get_members(cells, segment)
+            groups = (
+                members
+                .group_by(keys)
+                .agg(pl.col("_Cell"))
+                .sort(*keys[len(by):], *by)
+                .select(*encoding.get_labels(segment), "_Cell")
+            )
+            for *labels, cell_indices in groups.iter_rows():
+                total = totals[cell_indices].sum(axis=0)
+                replicate_total = replicate_totals[cell_indices].sum(axis=0)
+                estimate = total[1:] / total[0]
+                replicate_estimate = replicate_total[:, 1:] / replicate_total[:, :1]
+                se = np.sqrt(variance_factor * np.sum((replicate_estimate - estimate) ** 2, axis=0))
+                for column, value, error in zip(columns, estimate, se):
+                    records.append((*labels, column, value, error))
+
+    schema = {**frame.select(by).schema, "Segment": pl.String, "Group": pl.String}
+    return (
+        pl.DataFrame(
+            records,
+            schema={**schema, "Indicator": pl.String, "Value": pl.Float64, "SE": pl.Float64},
+            orient="row",
+        )
+        .with_columns(pl.col("Value", "SE").fill_nan(None))
+        .with_columns(
+            (pl.col("Value") - z * pl.col("SE")).alias("Lower"),
+            (pl.col("Value") + z * pl.col("SE")).alias("Upper"),
+        )
+    )
@@ -0,0 +1,113 @@
+"""
+The data files read by the app, built for static hosting.
+
+Only the files the app reads are published: the table index, its search
+index and query folding, the raw CSV files, the cleaned tables and the
+comparison bundle. Each one is gzip compressed (Polars reads compressed CSV
+directly, also in the browser) and named after its content hash,
+`<name>.<hash>.csv.gz`, so the files can be cached forever and a changed file
+gets a new name. The app resolves the original paths through a small
+manifest, the only file with a fixed name:
+
+    python -m cbi_hbs_summary.static_data --output-dir dist/Data
+"""
+
+import argparse
+import gzip
+from pathlib import Path
+import re
+
+import polars as pl
+
+from . import tracing
+from .manifest import hash_bytes, write_if_changed
+
+
+MANIFEST_NAME = "data_manifest.csv.gz"
+
+HASH_LENGTH = 12
+
+APP_FILES = [
+    "index.csv",
+    "search_index.csv",
+    "search_folding.csv",
+    "CSV_Files/*/*.csv",
+    "Cleaned_Tables/*.csv",
+    "Comparison_Bundle/comparisons.csv",
+]
+
+_HASHED_NAME = re.compile(rf"\.[0-9a-f]{{{HASH_LENGTH}}}\.csv\.gz$")
+
+
+def get_app_files(data_dir: str | Path) -> list[Path]:
+    """
+    Paths of the files read by the app, relative to `data_dir`.
+    """
+    data_dir = Path(data_dir)
+    return sorted({
+        path.relative_to(data_dir)
+        for pattern in APP_FILES
+        for path in data_dir.glob(pattern)
+    })
+
+
+def get_hashed_path(path: Path, digest: str) -> Path:
+    return path.with_name(f"{path.stem}.{digest[:HASH_LENGTH]}{path.suffix}.gz")
+
+
+def build_static_data(data_dir: str | Path, output_dir: str | Path) -> pl.DataFrame:
+    """
+    Write the compressed, content hashed app files and their manifest to
+    `output_dir`, remove hashed files of earlier builds and return the
+    manifest.
+    """
+    data_dir, output_dir = Path(data_dir), Path(output_dir)
+    rows = []
+    with tracing.span("build_static_data") as span:
+        for path in get_app_files(data_dir):
+            data = (data_dir / path).read_bytes()
+            digest = hash_bytes(data)
+            # Without a timestamp, the same content compresses to the same bytes
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            hashed_path = get_hashed_path(path, digest)
+            write_if_changed(output_dir / hashed_path, compressed)
+            rows.append({
+                "Path": path.as_posix(),
+                "Hashed_Path": hashed_path.as_posix(),
+                "Size": len(data),
+                "Compressed_Size": len(compressed),
+            })
+        manifest = pl.DataFrame(
+            rows,
+            schema={
+                "Path": pl.String,
+                "Hashed_Path": pl.String,
+                "Size": pl.Int64,
+                "Compressed_Size": pl.Int64,
+            },
+        )
+
+        published = {output_dir / p for p in manifest.get_column("Hashed_Path")}
+        for path in output_dir.rglob("*.gz"):
+            if _HASHED_NAME.search(path.name) and path not in published:
+                path.unlink()
+        write_if_changed(
+            output_dir / MANIFEST_NAME,
+            gzip.compress(manifest.write_csv().encode(), compresslevel=9, mtime=0),
+        )
+        span["files"] = manifest.height
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=Path("Data"))
+    parser.add_argument("--output-dir", type=Path, default=Path("dist/Data"))
+    args = parser.parse_args()
+    manifest = build_static_data(args.data_dir, args.output_dir)
+    size, compressed_size = manifest.select("Size", "Compressed_Size").sum().row(0)
+    print(f"{manifest.height} files, {size / 1e6:.1f} MB compressed to {compressed_size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from collections.abc import Iterable
+import io
+from pathlib import Path
+from typing import Literal
+
+import polars as pl
+
+from . import tracing
+from .manifest import write_if_changed
+
+
+_FORMAT = Literal["parquet", "csv"]
+
+YEAR_COLUMNS = ["Report_Year", "Year"]
+
+
+def cast_table(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Cast year columns to Int16 and every other column to Float64.
+    """
+    return df.cast({
+        c: pl.Int16 if c in YEAR_COLUMNS else pl.Float64
+        for c in df.columns
+    })
+
+
+def get_table_paths(path: str | Path) -> dict[_FORMAT, Path]:
+    """
+    File paths of a table stored under `path`, given without a suffix.
+    """
+    path = Path(path)
+    return {
+        "parquet": path.with_name(f"{path.name}.parquet"),
+        "csv": path.with_name(f"{path.name}.csv"),
+    }
+
+
+def write_table(
+    df: pl.DataFrame,
+    path: str | Path,
+    formats: Iterable[_FORMAT] = ("parquet", "csv"),
+) -> list[Path]:
+    """
+    Write a typed table as Parquet, with a CSV export next to it.
+
+    `path` is given without a suffix. Files whose content would not change
+    are left untouched.
+    """
+    df = cast_table(df)
+    paths = get_table_paths(path)
+    written = []
+    for table_format in formats:
+        with tracing.span(f"write_{table_format}", rows=df.height):
+            if table_format == "parquet":
+                buffer = io.BytesIO()
+                df.write_parquet(buffer)
+                content = buffer.getvalue()
+            else:
+                content = df.write_csv().encode()
+            write_if_changed(paths[table_format], content)
+        written.append(paths[table_format])
+    return written
+
+
+def read_table(path: str | Path) -> pl.DataFrame:
+    """
+    Read a table written by `write_table`, preferring the Parquet file and
+    falling back to the CSV export.
+    """
+    paths = get_table_paths(path)
+    with tracing.span("read_table", path=str(path)) as span:
+        if paths["parquet"].exists():
+            df = pl.read_parquet(paths["parquet"])
+        else:
+            df = cast_table(pl.read_csv(paths["csv"]))
+        span["rows"] = df.height
+    return df
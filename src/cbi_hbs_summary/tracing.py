@@ -0,0 +1,221 @@
+"""
+Opt-in timing and memory tracing of named pipeline stages.
+
+Tracing is off unless `enable()` is called or the `CBI_HBS_TRACE` environment
+variable is set to the path of the trace file, e.g.
+
+    CBI_HBS_TRACE=trace.json python draft.py
+
+Each span records its wall time, the CPU time of the process (including the
+Polars thread pool), the peak RSS of the process and, when memory tracing is
+on, the tracemalloc peak reached inside the span, with any attributes (such
+as row counts) attached to it. The spans can be written
+as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev) and
+summarized per stage with `summary()`. When tracing is enabled through the
+environment variable, the trace is written and the summary printed at exit.
+"""
+
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+import atexit
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+import tracemalloc
+
+import polars as pl
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+ENV_VAR = "CBI_HBS_TRACE"
+
+_lock = threading.Lock()
+_local = threading.local()
+_events: list[dict] = []
+_enabled = False
+_memory = False
+
+
+def enable(path: str | Path | None = None, memory: bool = True) -> None:
+    """
+    Start recording spans.
+
+    The setting is also exported through `CBI_HBS_TRACE`, so worker processes
+    started afterwards record their spans too.
+    """
+    global _enabled, _memory
+    _enabled = True
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    os.environ[ENV_VAR] = str(path or os.environ.get(ENV_VAR) or "trace.json")
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    os.environ.pop(ENV_VAR, None)
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _get_peak_rss() -> int | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    """
+    Record the enclosed block as a span named `name`.
+
+    Yields the attribute dictionary of the span, so values known only inside
+    the block can be attached, e.g. `s["rows"] = df.height`. Does nothing
+    when tracing is disabled.
+    """
+    if not _enabled:
+        yield attributes
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    memory = _memory and tracemalloc.is_tracing()
+    if memory:
+        # The tracemalloc peak is global, hand the peak so far to the parent
+        # span before measuring this one
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    frame = {"peak": 0}
+    stack.append(frame)
+
+    start_wall = time.perf_counter_ns()
+    start_cpu = time.process_time_ns()
+    start_ts = time.time_ns()
+    try:
+        yield attributes
+    finally:
+        wall = time.perf_counter_ns() - start_wall
+        cpu = time.process_time_ns() - start_cpu
+        stack.pop()
+        event = {
+            "name": name,
+            "ts": start_ts // 1000,
+            "dur": wall // 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": {
+                **attributes,
+                "cpu_ms": cpu / 1e6,
+                "peak_rss_mb": (_get_peak_rss() or 0) / 2**20,
+            },
+        }
+        if memory:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            event["args"]["tracemalloc_peak_mb"] = peak / 2**20
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        with _lock:
+            _events.append(event)
+
+
+def collect() -> list[dict]:
+    """
+    Return the recorded spans and forget them, e.g. to send them from a worker
+    process back to the parent.
+    """
+    with _lock:
+        events = _events.copy()
+        _events.clear()
+    return events
+
+
+def add_events(events: Iterable[dict]) -> None:
+    with _lock:
+        _events.extend(events)
+
+
+def get_events() -> list[dict]:
+    with _lock:
+        return _events.copy()
+
+
+def write_chrome_trace(path: str | Path | None = None) -> Path:
+    path = Path(path or os.environ.get(ENV_VAR) or "trace.json")
+    events = [{**event, "ph": "X", "cat": "cbi_hbs_summary"} for event in get_events()]
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text(
+        json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False, default=str),
+        encoding="utf-8",
+    )
+    return path
+
+
+def summary() -> pl.DataFrame:
+    """
+    Calls, total and mean wall time, CPU time, memory peaks and rows per span
+    name, slowest first.
+    """
+    events = get_events()
+    df = pl.DataFrame(
+        {
+            "Span": [e["name"] for e in events],
+            "Wall_ms": [e["dur"] / 1000 for e in events],
+            "CPU_ms": [e["args"]["cpu_ms"] for e in events],
+            "Peak_RSS_MB": [e["args"]["peak_rss_mb"] for e in events],
+            "Tracemalloc_Peak_MB": [e["args"].get("tracemalloc_peak_mb") for e in events],
+            "Rows": [e["args"].get("rows") for e in events],
+        },
+        schema={
+            "Span": pl.String,
+            "Wall_ms": pl.Float64,
+            "CPU_ms": pl.Float64,
+            "Peak_RSS_MB": pl.Float64,
+            "Tracemalloc_Peak_MB": pl.Float64,
+            "Rows": pl.Int64,
+        },
+    )
+    return (
+        df
+        .group_by("Span")
+        .agg(
+            pl.len().alias("Calls"),
+            pl.col("Wall_ms").sum().alias("Total_Wall_ms"),
+            pl.col("Wall_ms").mean().alias("Mean_Wall_ms"),
+            pl.col("CPU_ms").sum().alias("Total_CPU_ms"),
+            pl.col("Peak_RSS_MB").max().alias("Max_Peak_RSS_MB"),
+            pl.col("Tracemalloc_Peak_MB").max().alias("Max_Tracemalloc_Peak_MB"),
+            pl.col("Rows").sum().alias("Rows"),
+        )
+        .sort("Total_Wall_ms", descending=True)
+    )
+
+
+def _report_at_exit() -> None:
+    if not _enabled or not get_events():
+        return
+    path = write_chrome_trace()
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200):
+        print(summary(), file=sys.stderr)
+    print(f"Trace written to {path}", file=sys.stderr)
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR], memory=os.environ.get(f"{ENV_VAR}_MEMORY", "1") != "0")
+    # Worker processes send their spans to the parent instead
+    if multiprocessing.parent_process() is None:
+        atexit.register(_report_at_exit)
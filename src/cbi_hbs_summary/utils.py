@@ -1,3 +1,5 @@
+import re
+
 import polars as pl
 
 
@@ -20,7 +22,7 @@ UNWANTED_SYMBOLS = [
     "ـ",
     "_",
     "•",
-    "\\*",
+    "*",
     "`",
     "\"",
     "\'",
@@ -32,46 +34,96 @@ UNWANTED_SYMBOLS = [
 ]
 
 
+ARABIC_CHARACTERS = {
+    chr(1610): chr(1740), # ي -> ی
+    chr(1574): chr(1740), # ئ -> ی
+    chr(1609): chr(1740), # ى -> ی
+    chr(1571): chr(1575), # أ -> ا
+    chr(1573): chr(1575), # إ -> ا
+    chr(1572): chr(1608), # ؤ -> و
+    chr(1603): chr(1705), # ك -> ک
+    chr(1728): chr(1607), # ۀ -> ه
+    chr(1577): chr(1607), # ة -> ه
+}
+
+
+# Every single character replacement of the sanitization, applied in one pass:
+# Arabic characters to Farsi, Zero Width Non-Joiner ('\u200c') to a space, and
+# removal of the other invisible and unwanted characters
+CHARACTER_MAPPING = {
+    **ARABIC_CHARACTERS,
+    chr(8204): " ",
+    **{character: "" for character in INVISIBLE_CHARS + UNWANTED_SYMBOLS},
+}
+
+
+# Unicode White_Space characters other than the plain space, the set matched by
+# `\s` in the Polars (Rust) regex engine. Spelled out so Python's `re` matches
+# exactly the same set.
+_OTHER_WHITESPACE = "\t\n\v\f\r\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000"
+
+# Runs of whitespace and single non-space whitespace characters. Single spaces
+# are left alone since replacing them would not change anything.
+WHITESPACE_PATTERN = f"[ {_OTHER_WHITESPACE}]{{2,}}|[{_OTHER_WHITESPACE}]"
+
+# Characters dropped from table labels before they are matched with metadata
+LABEL_SEPARATORS_PATTERN = "[ ()،]"
+
+
 def sanitize_farsi_text(column: pl.Expr) -> pl.Expr:
     """
     Clean Farsi text by replacing Arabic characters, removing invisible and unwanted characters,
     normalizing spaces, and stripping leading/trailing spaces.
+
+    Equivalent to `sanitize_farsi_string` for a single string.
     """
 
     return (
         column
-        .pipe(replace_arabic_characters)
-
-        # Replace Zero Width Non-Joiner ('\u200c') with a space
-        .str.replace_all(chr(8204), " ")
-
-        # Remove other invisible and unwanted characters
-        .str.replace_all(
-            "[" + "".join(INVISIBLE_CHARS + UNWANTED_SYMBOLS) + "]", ""
-        )
+        .str.replace_many(CHARACTER_MAPPING)
 
         # Normalize spaces: replace all multi-space occurrences with a single space
-        .str.replace_all("\\s+", " ")
+        .str.replace_all(WHITESPACE_PATTERN, " ")
 
-        .str.strip_chars()
+        # Whitespace is now single spaces, so only spaces are left to strip
+        .str.strip_chars(" ")
 
-        .str.replace(r"\.0$", "")
+        .str.strip_suffix(".0")
     )
 
 
+_TRANSLATION_TABLE = str.maketrans(CHARACTER_MAPPING)
+_WHITESPACE_REGEX = re.compile(WHITESPACE_PATTERN)
+
+
+def sanitize_farsi_string(text: str) -> str:
+    """
+    Plain string version of `sanitize_farsi_text`.
+    """
+    text = text.translate(_TRANSLATION_TABLE)
+    text = _WHITESPACE_REGEX.sub(" ", text)
+    return text.strip(" ").removesuffix(".0")
+
+
+def sanitize_farsi_label(column: pl.Expr) -> pl.Expr:
+    """
+    Sanitize table labels and drop spaces, parentheses and Farsi commas.
+    """
+    return column.pipe(sanitize_farsi_text).str.replace_all(LABEL_SEPARATORS_PATTERN, "")
+
+
+_LABEL_SEPARATORS_REGEX = re.compile(LABEL_SEPARATORS_PATTERN)
+
+
+def sanitize_farsi_label_string(text: str) -> str:
+    """
+    Plain string version of `sanitize_farsi_label`.
+    """
+    return _LABEL_SEPARATORS_REGEX.sub("", sanitize_farsi_string(text))
+
+
 def replace_arabic_characters(column: pl.Expr) -> pl.Expr:
     """
     Replace Arabic characters with their Farsi equivalents in the Series.
     """
-    character_mapping = {
-        chr(1610): chr(1740), # ي -> ی
-        chr(1574): chr(1740), # ئ -> ی
-        chr(1609): chr(1740), # ى -> ی
-        chr(1571): chr(1575), # أ -> ا
-        chr(1573): chr(1575), # إ -> ا
-        chr(1572): chr(1608), # ؤ -> و
-        chr(1603): chr(1705), # ك -> ک
-        chr(1728): chr(1607), # ۀ -> ه
-        chr(1577): chr(1607), # ة -> ه
-    }
-    return column.str.replace_many(character_mapping)
+    return column.str.replace_many(ARABIC_CHARACTERS)